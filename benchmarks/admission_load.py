@@ -0,0 +1,157 @@
+"""Задержка обычных пользователей TaskBot, пока другие спамят командами.
+
+В одном процессе с mock Bot API: --abusers пользователей шлют /list и
+/add с частотой --abuse-rate в секунду каждый (открытая нагрузка, ответы
+не ждут), --users обычных пользователей раз в секунду шлют /list.
+Обновления проходят через update_processor, как при
+concurrent_updates в PTB. Замер идёт с допуском и без него; в отчёте
+p50/p99 обычных /list, число чтений страниц из базы и счётчики отказов и
+склеенных запросов.
+
+    python -m benchmarks.admission_load --seconds 5 --abusers 5
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from datetime import timedelta
+
+from telegram import Update
+from telegram.ext import Application
+
+from benchmarks.mock_bot_api import start_mock_server
+from benchmarks.suite import summary
+from bot.bot import TaskBot
+from config import (BOT_CONCURRENT_UPDATES, BOT_MAX_IN_FLIGHT,
+                    BOT_USER_BURST, BOT_USER_RATE)
+from core.admission import AdmissionControl
+from core.metrics import ADMISSION_REJECTED, COALESCED
+from core.reminders import utc_now
+from database.async_db import AsyncDatabase
+from database.cache import TaskCache
+
+ABUSER_ID_BASE = 1_000_000
+
+
+def make_update(update_id, user_id, text):
+    user = {'id': user_id, 'is_bot': False, 'first_name': 'load'}
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id, 'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'}, 'from': user,
+            'text': text,
+            'entities': [{'type': 'bot_command', 'offset': 0,
+                          'length': len(text.split()[0])}],
+        },
+    }
+
+
+def counter_value(counter, label):
+    return counter.labels(label)._value.get()
+
+
+class CountingDatabase:
+    """Считает чтения страниц, которые дошли до базы."""
+
+    def __init__(self, database):
+        self.database = database
+        self.page_reads = 0
+
+    async def get_tasks_page(self, *args, **kwargs):
+        self.page_reads += 1
+        return await self.database.get_tasks_page(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.database, name)
+
+
+async def run(url, api_url, args, admission):
+    application = (
+        Application.builder().token('1:load').base_url(f'{api_url}/bot')
+        .concurrent_updates(BOT_CONCURRENT_UPDATES).updater(None).build()
+    )
+    # Без кэша: каждое чтение, не склеенное с другим, идёт в базу.
+    database = CountingDatabase(AsyncDatabase(url, cache=TaskCache(ttl=0)))
+    bot = TaskBot(application, database, admission=admission)
+    bot.register_handlers()
+    await application.initialize()
+    await bot.post_init(application)
+    processor = application.update_processor
+    update_ids = iter(range(1, 10 ** 9))
+    deadline = (utc_now() + timedelta(days=3)).strftime('%d-%m-%Y-%H-%M')
+    pending = set()
+    latencies = []
+
+    async def process(user_id, text, record):
+        update = Update.de_json(
+            make_update(next(update_ids), user_id, text), application.bot)
+        started = time.perf_counter()
+        await processor.process_update(update,
+                                       application.process_update(update))
+        if record:
+            latencies.append(time.perf_counter() - started)
+
+    def submit(user_id, text, record=False):
+        task = asyncio.ensure_future(process(user_id, text, record))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+
+    async def abuser(user_id):
+        interval = 1 / args.abuse_rate
+        commands = ('/list', f'/add spam {deadline}')
+        for n in range(int(args.seconds * args.abuse_rate)):
+            submit(user_id, commands[n % 2])
+            await asyncio.sleep(interval)
+
+    async def user(user_id):
+        for _ in range(args.seconds):
+            submit(user_id, '/list', record=True)
+            await asyncio.sleep(1)
+
+    await asyncio.gather(
+        *(abuser(ABUSER_ID_BASE + n) for n in range(args.abusers)),
+        *(user(n + 1) for n in range(args.users)))
+    await asyncio.gather(*pending)
+    await bot.post_shutdown(application)
+    await application.shutdown()
+    return summary(latencies), database.page_reads
+
+
+async def main_async(args):
+    url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    server, api_url = start_mock_server()
+    for name in ('без допуска', 'с допуском'):
+        admission = None
+        if name == 'с допуском':
+            admission = AdmissionControl(BOT_USER_RATE, BOT_USER_BURST,
+                                         BOT_MAX_IN_FLIGHT)
+        before = {reason: counter_value(ADMISSION_REJECTED, reason)
+                  for reason in ('user', 'overload')}
+        coalesced = counter_value(COALESCED, 'get_tasks_page')
+        result, page_reads = await run(url, api_url, args, admission)
+        rejected = {reason: int(counter_value(ADMISSION_REJECTED, reason) -
+                                value)
+                    for reason, value in before.items()}
+        print(f'{name:12} обычные /list: p50={result["p50_ms"]:8.1f} мс '
+              f'p99={result["p99_ms"]:8.1f} мс (n={result["n"]}); '
+              f'чтений страниц: {page_reads}; отказы: {rejected}; '
+              f'склеено: '
+              f'{int(counter_value(COALESCED, "get_tasks_page") - coalesced)}'
+              )
+    server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seconds', type=int, default=5)
+    parser.add_argument('--abusers', type=int, default=5)
+    parser.add_argument('--abuse-rate', type=float, default=200)
+    parser.add_argument('--users', type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == '__main__':
+    main()
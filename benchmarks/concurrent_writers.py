@@ -0,0 +1,74 @@
+"""Конкурентные писатели в одну БД, как бот, воркер Celery и beat.
+
+Каждый процесс пишет задачи отдельными транзакциями. Сравнивает engine
+по умолчанию (--untuned) и create_db_engine с WAL/busy_timeout или пулом.
+
+    python -m benchmarks.concurrent_writers --processes 4 --writes 500
+    python -m benchmarks.concurrent_writers --url postgresql://...
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, exc
+from sqlalchemy.orm import sessionmaker
+
+from database.db import Database
+from database.engine import create_db_engine
+from database.models import Task
+
+
+def writer(url, writes, untuned, results):
+    engine = create_engine(url) if untuned else create_db_engine(url)
+    Session = sessionmaker(bind=engine)
+    deadline = datetime.now() + timedelta(days=2)
+    ok = locked = 0
+    for i in range(writes):
+        with Session() as session:
+            try:
+                session.add(Task(description=f'bench {i}',
+                                 deadline=deadline, user_id=os.getpid()))
+                session.commit()
+                ok += 1
+            except exc.OperationalError:
+                session.rollback()
+                locked += 1
+    engine.dispose()
+    results.put((ok, locked))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url')
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--writes', type=int, default=500)
+    parser.add_argument('--untuned', action='store_true')
+    args = parser.parse_args()
+    url = args.url or (
+        f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}")
+    database = Database(url)
+    database.init_db()
+    database.engine.dispose()
+
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(
+        target=writer, args=(url, args.writes, args.untuned, results))
+        for _ in range(args.processes)]
+    started = time.perf_counter()
+    for process in processes:
+        process.start()
+    totals = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - started
+    ok = sum(t[0] for t in totals)
+    locked = sum(t[1] for t in totals)
+    print(f"{'untuned' if args.untuned else 'tuned':8} ok={ok} "
+          f'locked={locked} elapsed={elapsed:.2f}s rate={ok / elapsed:.0f}/s')
+
+
+if __name__ == '__main__':
+    main()
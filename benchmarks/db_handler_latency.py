@@ -0,0 +1,108 @@
+"""Задержка обработчиков при конкурентной нагрузке на разных слоях БД.
+
+Каждый «обработчик» добавляет задачу и читает список задач пользователя,
+как /add и /list. Параллельно лёгкий обработчик без БД (как /start)
+замеряет, насколько его задерживает занятый event loop. Режим sync
+вызывает Database прямо в event loop, как это делал TaskBot раньше.
+
+    python -m benchmarks.db_handler_latency --handlers 500 --concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from database.async_db import AsyncDatabase, ThreadedDatabase
+from database.db import Database
+
+
+class InlineDatabase:
+    """Прежнее поведение: синхронные вызовы прямо из корутины."""
+
+    def __init__(self, database):
+        self.database = database
+
+    async def init_db(self):
+        pass
+
+    async def close(self):
+        self.database.engine.dispose()
+
+    async def add_task(self, *args):
+        return self.database.add_task(*args)
+
+    async def get_tasks(self, *args):
+        return self.database.get_tasks(*args)
+
+
+def make_database(mode, url):
+    if mode == 'sync':
+        return InlineDatabase(Database(url))
+    if mode == 'threads':
+        return ThreadedDatabase(Database(url))
+    return AsyncDatabase(url)
+
+
+async def handler(database, user_id, latencies):
+    started = time.perf_counter()
+    await database.add_task('benchmark', datetime.now() + timedelta(days=2),
+                            user_id)
+    await database.get_tasks(user_id)
+    latencies.append(time.perf_counter() - started)
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[max(int(len(values) * share) - 1, 0)]
+
+
+async def probe(lags, stop):
+    """Лёгкий обработчик: сколько он ждёт сверх запрошенной 1 мс."""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.001)
+        lags.append(time.perf_counter() - started - 0.001)
+
+
+async def run(mode, handlers, concurrency):
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    database = make_database(mode, f'sqlite:///{path}')
+    await database.init_db()
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    lags = []
+    stop = asyncio.Event()
+    prober = asyncio.create_task(probe(lags, stop))
+
+    async def guarded(user_id):
+        async with semaphore:
+            await handler(database, user_id, latencies)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(guarded(i % 100 + 1) for i in range(handlers)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await prober
+    await database.close()
+    print(f'{mode:8} db p50={statistics.median(latencies) * 1000:.1f}ms '
+          f'db p99={percentile(latencies, 0.99) * 1000:.1f}ms '
+          f'light p99={percentile(lags, 0.99) * 1000:.1f}ms '
+          f'rate={handlers / elapsed:.0f}/s')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--handlers', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--modes', nargs='+',
+                        default=['sync', 'threads', 'native'])
+    args = parser.parse_args()
+    for mode in args.modes:
+        asyncio.run(run(mode, args.handlers, args.concurrency))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+"""Пропускная способность TelegramSender против локального mock Bot API.
+
+    python -m benchmarks.delivery_throughput --messages 2000 --chats 500
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks.mock_bot_api import start_mock_server
+from core.delivery import TelegramSender
+
+
+async def run(messages, chats, concurrency):
+    server, api_url = start_mock_server()
+    batch = [{'id': str(i), 'chat_id': i % chats + 1, 'text': f'task {i}',
+              'attempt': 0} for i in range(messages)]
+    # Лимиты Telegram отключены: меряем сам транспорт.
+    sender = TelegramSender(token='bench', api_url=api_url,
+                            concurrency=concurrency,
+                            global_rate=10 ** 9, chat_rate=10 ** 9)
+    started = time.perf_counter()
+    async with sender:
+        retries = await sender.send_batch(batch)
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+    print(f'sent={len(server.requests)} retries={len(retries)} '
+          f'elapsed={elapsed:.3f}s rate={messages / elapsed:.0f} msg/s')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--chats', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(run(args.messages, args.chats, args.concurrency))
+
+
+if __name__ == '__main__':
+    main()
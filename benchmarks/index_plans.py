@@ -0,0 +1,106 @@
+"""EXPLAIN-планы и время горячих запросов до и после миграций индексов.
+
+Строит таблицу tasks в исходной схеме (без индексов), заполняет её,
+замеряет запросы, затем применяет migrate() к «живой» базе и замеряет
+снова.
+
+    python -m benchmarks.index_plans --rows 1000000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, select, text
+
+from database.db import due_tasks_query
+from database.engine import create_db_engine
+from database.migrations import migrate
+from database.models import Task
+
+BASELINE_DDL = (
+    'CREATE TABLE tasks (id INTEGER PRIMARY KEY, description VARCHAR NOT '
+    'NULL, deadline DATETIME NOT NULL, user_id INTEGER NOT NULL, '
+    'is_completed BOOLEAN)'
+)
+
+
+def hot_queries(user_id, now, scheduled):
+    """Горячие запросы; due_tasks — только при столбце next_remind_at."""
+    queries = {
+        'get_tasks': select(Task.id, Task.description, Task.deadline)
+        .filter_by(user_id=user_id, is_completed=False)
+        .order_by(Task.deadline, Task.id),
+        'get_all_not_completed_tasks': select(func.count())
+        .select_from(Task).filter_by(is_completed=False),
+        'open_by_deadline': select(Task.id).filter_by(is_completed=False)
+        .filter(Task.deadline <= now).limit(100),
+        'get_all_user_ids': select(Task.user_id).distinct(),
+    }
+    if scheduled:
+        queries['due_tasks'] = due_tasks_query(now)
+    return queries
+
+
+def populate(connection, rows, users):
+    now = datetime.now()
+    chunk = []
+    for i in range(rows):
+        chunk.append({
+            'description': f'task {i}',
+            'deadline': now + timedelta(minutes=random.randint(-10**5,
+                                                               10**5)),
+            'user_id': random.randint(1, users),
+            'is_completed': random.random() < 0.8,
+        })
+        if len(chunk) == 10000:
+            connection.execute(insert(Task.__table__), chunk)
+            chunk = []
+    if chunk:
+        connection.execute(insert(Task.__table__), chunk)
+    connection.commit()
+
+
+def measure(connection, label, users, repeats, scheduled=False):
+    print(f'--- {label}')
+    now = datetime.now()
+    for name, query in hot_queries(1, now, scheduled).items():
+        compiled = query.compile(connection, compile_kwargs={
+            'literal_binds': True})
+        plan = connection.execute(
+            text(f'EXPLAIN QUERY PLAN {compiled}')).fetchall()
+        started = time.perf_counter()
+        for _ in range(repeats):
+            user_id = random.randint(1, users)
+            connection.execute(
+                hot_queries(user_id, now, scheduled)[name]).fetchall()
+        elapsed = (time.perf_counter() - started) / repeats
+        print(f'{name:28} {elapsed * 1000:9.2f} ms  '
+              f"{' | '.join(row[-1] for row in plan)}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--repeats', type=int, default=20)
+    args = parser.parse_args()
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    engine = create_db_engine(f'sqlite:///{path}')
+    with engine.connect() as connection:
+        connection.execute(text(BASELINE_DDL))
+        populate(connection, args.rows, args.users)
+        measure(connection, 'до миграций', args.users, args.repeats)
+        started = time.perf_counter()
+        migrate(connection)
+        print(f'--- migrate(): {time.perf_counter() - started:.1f}s')
+        connection.execute(text('ANALYZE'))
+        connection.commit()
+        measure(connection, 'после миграций', args.users, args.repeats,
+                scheduled=True)
+
+
+if __name__ == '__main__':
+    main()
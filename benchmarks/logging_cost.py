@@ -0,0 +1,68 @@
+"""Сколько стоит логирование на одно обработанное обновление.
+
+Повторяет записи, которые делает /list: DEBUG о команде, открытие и
+закрытие сессии, INFO с числом задач. Сравнивает запись в файл в
+вызывающем потоке (sync) и через очередь (queue) на уровнях DEBUG/INFO,
+и отдельно стоимость форматирования записи.
+
+    python -m benchmarks.logging_cost --updates 20000
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+from core.logger import OvayLogger
+
+
+def handle_update(logger, user_id, tasks):
+    logger.debug('Запущена команда /list')
+    logger.debug('🟦Открываем сессию к базе данных...')
+    logger.info('Получено задач для пользователя %s: %d.', user_id,
+                len(tasks))
+    logger.debug('🟦Закрываем соединение с базой данных.')
+
+
+def run(mode, level, updates):
+    path = os.path.join(tempfile.mkdtemp(), 'bench.log')
+    logger = OvayLogger(name=f'bench_{mode}_{level}', log_file_path=path,
+                        level=level, mode=mode).get_logger()
+    tasks = list(range(50))
+    started = time.perf_counter()
+    for i in range(updates):
+        handle_update(logger, i, tasks)
+    elapsed = time.perf_counter() - started
+    OvayLogger.flush()
+    drained = time.perf_counter() - started
+    print(f'{mode:6} {level:6} {elapsed / updates * 1e6:8.1f} µs/update '
+          f'в обработчике, {drained / updates * 1e6:8.1f} µs/update '
+          f'до записи на диск')
+
+
+def format_cost(records):
+    """Стоимость OvayFormatter.format на запись в фоновом писателе."""
+    formatter = OvayLogger.formatter('Europe/Moscow')
+    record = logging.LogRecord('bench', logging.INFO, __file__, 1,
+                               'Получено задач для пользователя %s: %d.',
+                               (1, 50), None, func='handle_update')
+    started = time.perf_counter()
+    for _ in range(records):
+        record.created = time.time()
+        formatter.format(record)
+    elapsed = time.perf_counter() - started
+    print(f'format {elapsed / records * 1e6:8.2f} µs/record')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--updates', type=int, default=20000)
+    args = parser.parse_args()
+    for mode in ('sync', 'queue'):
+        for level in ('DEBUG', 'INFO'):
+            run(mode, level, args.updates)
+    format_cost(args.updates)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Локальный mock Telegram Bot API для замеров без обращения к Telegram."""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'mock',
+            'username': 'mock_bot'}
+
+
+def _result(method, payload, message_id):
+    if method == 'getMe':
+        return BOT_USER
+    if method in ('sendMessage', 'editMessageText'):
+        chat_id = int(payload.get('chat_id', 0))
+        return {'message_id': message_id, 'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+                'text': payload.get('text', '')}
+    return True
+
+
+class MockBotApiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Заголовки и тело уходят отдельными write: без TCP_NODELAY каждый
+    # ответ ждёт delayed ACK клиента (~40 мс).
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length).decode()
+        if 'json' in self.headers.get('Content-Type', ''):
+            payload = json.loads(body or '{}')
+        else:
+            payload = dict(parse_qsl(body))
+        method = self.path.rsplit('/', 1)[-1]
+        with self.server.lock:
+            self.server.requests.append(payload)
+            self.server.events.append((time.monotonic(), method, payload))
+            message_id = len(self.server.requests)
+        response = json.dumps({
+            'ok': True, 'result': _result(method, payload, message_id)
+        }).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockBotApiServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Бот открывает десятки соединений разом; очередь accept по умолчанию 5.
+    request_queue_size = 1024
+
+
+def start_mock_server(port=0):
+    """Запускает сервер в фоновом потоке; возвращает (server, base_url).
+
+    server.requests — тела всех запросов, server.events — (time.monotonic(),
+    метод, тело) для расчёта задержек.
+    """
+    server = MockBotApiServer(('127.0.0.1', port), MockBotApiHandler)
+    server.requests = []
+    server.events = []
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
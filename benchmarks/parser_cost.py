@@ -0,0 +1,60 @@
+"""Стоимость разбора строки /add: прежний путь против core.parser.
+
+Прежний путь — re.findall с некомпилированным шаблоном, str.replace по
+всей строке и datetime.strptime. Проверки разбора на случайных строках —
+в tests/test_parser.py.
+
+    python -m benchmarks.parser_cost --lines 100000
+"""
+import argparse
+import re
+import time
+from datetime import datetime
+
+from core.parser import parse_task
+
+SAMPLES = [
+    'Купить молоко 31-12-2030-18-30',
+    'Позвонить маме +2h',
+    'Отчёт по проекту завтра 10:00',
+    'Длинное описание задачи с несколькими словами и цифрами 123 '
+    '01-02-2031-09-05 и хвостом после даты',
+]
+
+
+def legacy_parse(line):
+    result = re.findall(r'\d{2}-\d{2}-\d{4}-\d{2}-\d{2}', line)
+    if not result:
+        raise ValueError(line)
+    description = line.replace(result[0], '').strip()
+    return description, datetime.strptime(result[0], '%d-%m-%Y-%H-%M')
+
+
+def measure(name, func, lines):
+    started = time.perf_counter()
+    for line in lines:
+        try:
+            func(line)
+        except ValueError:
+            pass
+    elapsed = time.perf_counter() - started
+    print(f'{name:28} {elapsed / len(lines) * 1e6:7.2f} µs/строка')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lines', type=int, default=100000)
+    args = parser.parse_args()
+    now = datetime(2030, 6, 1, 12, 0)
+    lines = [SAMPLES[i % len(SAMPLES)] for i in range(args.lines)]
+    absolute = [line for line in lines if re.search(r'\d{4}-\d{2}-\d{2}',
+                                                    line)]
+    measure('прежний (только DD-MM-...)', legacy_parse, absolute)
+    measure('core.parser (DD-MM-...)',
+            lambda line: parse_task(line, now), absolute)
+    measure('core.parser (все формы)', lambda line: parse_task(line, now),
+            lines)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Пиковый RSS и время чтения открытых задач на больших таблицах.
+
+Заполняет базу (по умолчанию 1M строк, ~20% открытых) и в отдельном
+процессе на каждый замер вызывает get_all_not_completed_tasks и
+get_due_tasks с моментом через 60 дней — в выборку попадают все открытые
+задачи, как при догоняющем обходе. Отдельный процесс нужен, чтобы
+ru_maxrss относился только к одному методу.
+
+    python -m benchmarks.scan_memory --rows 1000000
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+from benchmarks.suite import populate
+from core.reminders import utc_now
+from database.db import Database
+
+METHODS = ('get_all_not_completed_tasks', 'get_due_tasks')
+
+
+def measure(url, method):
+    database = Database(url)
+    database.init_db()
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    if method == 'get_due_tasks':
+        tasks = database.get_due_tasks(utc_now() + timedelta(days=60))
+    else:
+        tasks = getattr(database, method)()
+    elapsed = time.perf_counter() - started
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({'method': method, 'rows': len(tasks),
+                      'seconds': round(elapsed, 3),
+                      'peak_rss_mb': round(rss_after / 1024, 1),
+                      'delta_rss_mb': round((rss_after - rss_before) / 1024,
+                                            1)}))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--users', type=int, default=50_000)
+    parser.add_argument('--measure', nargs=2, metavar=('URL', 'METHOD'),
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.measure:
+        measure(*args.measure)
+        return
+
+    url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    database = Database(url)
+    database.init_db()
+    populate(database.engine, args.rows, args.users)
+    database.engine.dispose()
+    for method in METHODS:
+        result = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.scan_memory',
+             '--measure', url, method],
+            capture_output=True, text=True, check=True)
+        print(result.stdout.strip())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""Время холодного старта процессов бота и Celery.
+
+Каждый замер — новый интерпретатор, в отчёте медиана из --repeats:
+
+* import-tasks — импорт tasks, как в каждом воркере, beat и Flower;
+* tasks-first-query — импорт tasks и первый запрос к базе вместе с
+  проверкой схемы (с --migrate off — без неё);
+* main — `python main.py` с mock Bot API до открытия порта /healthz;
+* worker — `celery -A tasks:celery_app worker` до строки «ready.»;
+  брокер — memory://, Redis не нужен.
+
+    python -m benchmarks.startup --repeats 5
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.mock_bot_api import start_mock_server
+from database.db import Database
+
+TARGETS = ('import-tasks', 'tasks-first-query', 'main', 'worker')
+SNIPPETS = {
+    'import-tasks': 'import tasks',
+    'tasks-first-query': 'import tasks; tasks.database.get_all_user_ids()',
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def run_snippet(code, env):
+    started = time.perf_counter()
+    subprocess.run([sys.executable, '-c', code], env=env, check=True)
+    return time.perf_counter() - started
+
+
+def run_main(env, timeout):
+    """Секунды от запуска main.py до открытия порта /healthz.
+
+    Порт открывается в post_init, после инициализации бота и базы; ответ
+    /healthz не ждём — он зависит от таймаутов проверок Redis и Celery.
+    """
+    port = free_port()
+    env = dict(env, METRICS_PORT=str(port))
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, 'main.py'], env=env,
+                               stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                socket.create_connection(('127.0.0.1', port), 0.1).close()
+                return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.005)
+        raise TimeoutError('main.py не открыл порт /healthz')
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def run_worker(env, timeout, concurrency):
+    """Секунды от запуска воркера Celery до строки «ready.» в логе."""
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        ['celery', '-A', 'tasks:celery_app', 'worker', '--loglevel=info',
+         f'--concurrency={concurrency}'],
+        env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    try:
+        for line in process.stdout:
+            if 'ready.' in line:
+                return time.perf_counter() - started
+            if time.perf_counter() - started > timeout:
+                break
+        raise TimeoutError('воркер Celery не дошёл до ready')
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--targets', nargs='+', choices=TARGETS,
+                        default=list(TARGETS))
+    parser.add_argument('--migrate', choices=('auto', 'off'),
+                        default='auto')
+    parser.add_argument('--concurrency', type=int, default=2)
+    parser.add_argument('--timeout', type=float, default=30)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    url = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+    # Схема создаётся заранее, как шагом развёртывания.
+    database = Database(url)
+    database.init_db()
+    database.engine.dispose()
+    server, api_url = start_mock_server()
+    env = dict(os.environ, DATABASE_URL=url, DATABASE_MIGRATE=args.migrate,
+               BOT_LOG_FILE_PATH=os.path.join(directory, 'bot.log'),
+               TELEGRAM_TOKEN='1:startup', TELEGRAM_API_URL=api_url,
+               CELERY_BROKER_URL='memory://', CELERY_METRICS_PORT='0',
+               PYTHONPATH=os.getcwd())
+
+    for target in args.targets:
+        samples = []
+        for _ in range(args.repeats):
+            if target == 'main':
+                samples.append(run_main(env, args.timeout))
+            elif target == 'worker':
+                samples.append(run_worker(env, args.timeout,
+                                          args.concurrency))
+            else:
+                samples.append(run_snippet(SNIPPETS[target], env))
+        print(f'{target:20} p50={statistics.median(samples) * 1000:8.1f} мс '
+              f'max={max(samples) * 1000:8.1f} мс')
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
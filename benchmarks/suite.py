@@ -0,0 +1,370 @@
+"""Сводный набор замеров: CRUD Database, тик напоминаний, обработчики бота.
+
+Для каждого размера таблицы (по умолчанию 1k, 100k и 1M строк, ~20%
+открытых задач) заполняет отдельную SQLite-базу и замеряет:
+
+- методы Database по отдельности (p50/p99/mean, мс);
+- тик напоминаний: все шарды send_reminders_shard подряд в процессе —
+  первый тик с накопившимся хвостом и установившиеся ежеминутные тики;
+- обработчики TaskBot на синтетических Update против mock Bot API.
+
+Redis в тике заменён словарём в памяти, так что сетевые задержки Redis в
+замер не входят. Результаты пишутся в JSON с плоскими ключами вида
+"db/get_tasks/rows=100000"; --compare сравнивает с прошлым прогоном и
+завершается с кодом 1, если что-то стало медленнее больше чем на
+--threshold.
+
+    python -m benchmarks.suite --sizes 1000 100000 1000000 --out bench.json
+    python -m benchmarks.suite --sizes 1000 --compare bench.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+import sqlalchemy
+from sqlalchemy import insert
+from telegram import Update
+from telegram.ext import Application
+
+import config
+from benchmarks.mock_bot_api import start_mock_server
+from bot.bot import TaskBot
+from core.delivery import ENQUEUE_ONCE_SCRIPT
+from core.reminders import utc_now
+from database.async_db import AsyncDatabase
+from database.cache import TaskCache
+from database.db import Database
+from database.models import Task
+
+OPEN_SHARE = 0.2
+TASKS_PER_USER = 20
+BOT_USER_ID = 1
+
+
+def summary(samples):
+    samples = sorted(samples)
+    return {
+        'n': len(samples),
+        'p50_ms': round(statistics.median(samples) * 1000, 3),
+        'p99_ms': round(samples[max(int(len(samples) * 0.99) - 1, 0)] * 1000,
+                        3),
+        'mean_ms': round(statistics.fmean(samples) * 1000, 3),
+    }
+
+
+def timed(func, repeats):
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return summary(samples)
+
+
+async def timed_async(func, repeats):
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        await func()
+        samples.append(time.perf_counter() - started)
+    return summary(samples)
+
+
+def populate(engine, rows, users):
+    """Заполняет tasks; next_remind_at открытых задач — от суток назад до
+    месяца вперёд, дедлайн на 3 часа позже (местное время Минска)."""
+    now = utc_now()
+    chunk = []
+    with engine.begin() as connection:
+        for i in range(rows):
+            remind_at = now + timedelta(minutes=random.randint(-1440,
+                                                               30 * 1440))
+            chunk.append({
+                'description': f'task {i}',
+                'deadline': remind_at + timedelta(hours=3),
+                'user_id': random.randint(1, users),
+                'is_completed': random.random() >= OPEN_SHARE,
+                'next_remind_at': remind_at,
+            })
+            if len(chunk) == 10000:
+                connection.execute(insert(Task), chunk)
+                chunk = []
+        if chunk:
+            connection.execute(insert(Task), chunk)
+
+
+def bench_database(database, rows, users, repeats):
+    deadline = utc_now() + timedelta(days=3)
+
+    def user():
+        return random.randint(1, users)
+
+    def add_and_get_ids(count):
+        created = database.add_tasks([('bench', deadline, BOT_USER_ID)] *
+                                     count)
+        return [task.id for task in created]
+
+    add_and_get_ids(20)
+    cursor_task = database.get_tasks_page(BOT_USER_ID)[0][-1]
+    cursor = (cursor_task.deadline, cursor_task.id)
+    ids = add_and_get_ids(repeats * 4)
+
+    results = {
+        'add_task': timed(
+            lambda: database.add_task('bench', deadline, user()), repeats),
+        'add_tasks_x10': timed(
+            lambda: database.add_tasks([('bench', deadline, user())] * 10),
+            repeats),
+        'get_tasks': timed(lambda: database.get_tasks(user()), repeats),
+        'get_tasks_page': timed(
+            lambda: database.get_tasks_page(user()), repeats),
+        'get_tasks_page_after': timed(
+            lambda: database.get_tasks_page(BOT_USER_ID, after=cursor),
+            repeats),
+        'complete_task': timed(
+            lambda: database.complete_task(ids.pop()), repeats),
+        'complete_tasks_x1': timed(
+            lambda: database.complete_tasks([ids.pop()], BOT_USER_ID),
+            repeats),
+        'delete_task': timed(
+            lambda: database.delete_task(ids.pop()), repeats),
+        'delete_tasks_x1': timed(
+            lambda: database.delete_tasks([ids.pop()], BOT_USER_ID),
+            repeats),
+        'get_all_user_ids': timed(database.get_all_user_ids,
+                                  min(repeats, 5)),
+    }
+    return {f'db/{name}/rows={rows}': value
+            for name, value in results.items()}
+
+
+class MemoryRedis:
+    """Ровно то, что нужно тику: журнал слотов и дайджесты в словарях."""
+
+    def __init__(self):
+        self.sent = {}
+        self.digests = {}
+
+    def eval(self, script, numkeys, *args):
+        if script != ENQUEUE_ONCE_SCRIPT:
+            raise NotImplementedError(script)
+        member, slot_score, cutoff, flush_at, chat_id, text = args[numkeys:]
+        if member in self.sent:
+            return 0
+        self.sent[member] = slot_score
+        self.digests.setdefault(chat_id, []).append(text)
+        return 1
+
+    def pipeline(self, transaction=True):
+        return MemoryPipeline(self)
+
+
+class MemoryPipeline:
+    def __init__(self, redis_client):
+        self.redis = redis_client
+        self.calls = []
+
+    def eval(self, *args):
+        self.calls.append(args)
+
+    def execute(self):
+        calls, self.calls = self.calls, []
+        return [self.redis.eval(*args) for args in calls]
+
+
+def bench_tick(tasks, rows, steady_ticks):
+    tasks.redis_client = MemoryRedis()
+    shards = config.REMINDER_SHARDS
+    now = utc_now()
+
+    def tick(at):
+        started = time.perf_counter()
+        for shard in range(shards):
+            tasks.send_reminders_shard(shard, shards, at.isoformat())
+        return time.perf_counter() - started
+
+    catchup = tick(now)
+    catchup_due = len(tasks.redis_client.sent)
+    steady = []
+    for minute in range(1, steady_ticks + 1):
+        steady.append(tick(now + timedelta(minutes=minute)))
+    return {
+        f'tick/catchup/rows={rows}': dict(summary([catchup]),
+                                          due=catchup_due),
+        f'tick/steady/rows={rows}': dict(
+            summary(steady),
+            due=len(tasks.redis_client.sent) - catchup_due),
+    }
+
+
+USER = {'id': BOT_USER_ID, 'is_bot': False, 'first_name': 'bench'}
+
+
+def message_update(update_id, text):
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id, 'date': int(time.time()),
+            'chat': {'id': BOT_USER_ID, 'type': 'private'}, 'from': USER,
+            'text': text,
+            'entities': [{'type': 'bot_command', 'offset': 0,
+                          'length': len(text.split()[0])}],
+        },
+    }
+
+
+def callback_update(update_id, data):
+    update = message_update(update_id, '/list')
+    message = update.pop('message')
+    message['from'] = {'id': 1, 'is_bot': True, 'first_name': 'mock'}
+    update['callback_query'] = {
+        'id': str(update_id), 'from': USER, 'chat_instance': '1',
+        'message': message, 'data': data,
+    }
+    return update
+
+
+async def bench_handlers(url, api_url, rows, repeats):
+    application = (
+        Application.builder().token('1:bench').base_url(f'{api_url}/bot')
+        .updater(None).build()
+    )
+    bot = TaskBot(application, AsyncDatabase(url, cache=TaskCache()))
+    bot.register_handlers()
+    await application.initialize()
+    await bot.post_init(application)
+    update_ids = iter(range(1, 10 ** 9))
+
+    async def process(payload):
+        await application.process_update(
+            Update.de_json(payload, application.bot))
+
+    deadline = (utc_now() + timedelta(days=3)).strftime('%d-%m-%Y-%H-%M')
+    ids = iter(task.id for task in await bot.database.add_tasks(
+        [('bench', utc_now() + timedelta(days=3), BOT_USER_ID)] *
+        (repeats * 2 + 20)))
+    page, _ = await bot.database.get_tasks_page(BOT_USER_ID)
+    cursor = bot.page_callback('next', page[-1])
+    add_many = '/add ' + '\n'.join(f'bench {n} {deadline}'
+                                   for n in range(10))
+    commands = {
+        'start': lambda: message_update(next(update_ids), '/start'),
+        'add': lambda: message_update(next(update_ids),
+                                      f'/add bench {deadline}'),
+        'add_x10': lambda: message_update(next(update_ids), add_many),
+        'list': lambda: message_update(next(update_ids), '/list'),
+        'list_next': lambda: callback_update(next(update_ids), cursor),
+        'complete': lambda: message_update(next(update_ids),
+                                           f'/complete {next(ids)}'),
+        'delete': lambda: message_update(next(update_ids),
+                                         f'/delete {next(ids)}'),
+    }
+    results = {}
+    for name, make in commands.items():
+        results[f'handler/{name}/rows={rows}'] = await timed_async(
+            lambda: process(make()), repeats)
+    await bot.post_shutdown(application)
+    await application.shutdown()
+    return results
+
+
+def metadata(args):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=root,
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'sqlalchemy': sqlalchemy.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'args': vars(args),
+    }
+
+
+def compare(results, baseline_path, threshold):
+    """Печатает изменение p50 против baseline; возвращает число регрессий."""
+    with open(baseline_path) as file:
+        baseline = json.load(file)['results']
+    regressions = 0
+    for name, value in results.items():
+        old = baseline.get(name)
+        if not old or not old['p50_ms']:
+            continue
+        change = value['p50_ms'] / old['p50_ms'] - 1
+        mark = ''
+        if change > threshold:
+            mark = '  <-- регрессия'
+            regressions += 1
+        print(f'{name:45} {old["p50_ms"]:10.3f} -> {value["p50_ms"]:10.3f}'
+              f' ms ({change:+.0%}){mark}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[1000, 100_000, 1_000_000])
+    parser.add_argument('--repeats', type=int, default=100)
+    parser.add_argument('--steady-ticks', type=int, default=5)
+    parser.add_argument('--groups', nargs='+',
+                        default=['db', 'tick', 'handler'])
+    parser.add_argument('--out', default='bench.json')
+    parser.add_argument('--compare')
+    parser.add_argument('--threshold', type=float, default=0.2)
+    args = parser.parse_args()
+
+    # tasks создаёт Database(DATABASE_URL) при импорте: пусть это будет
+    # база в памяти, а не рабочий файл.
+    config.DATABASE_URL = 'sqlite://'
+    import tasks
+
+    server, api_url = start_mock_server()
+    results = {}
+    for rows in args.sizes:
+        url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+        database = Database(url)
+        database.init_db()
+        users = max(rows // TASKS_PER_USER, 1)
+        started = time.perf_counter()
+        populate(database.engine, rows, users)
+        print(f'rows={rows}: заполнено за '
+              f'{time.perf_counter() - started:.1f} с', file=sys.stderr)
+        if 'tick' in args.groups:
+            tasks.database = database
+            results.update(bench_tick(tasks, rows, args.steady_ticks))
+        if 'db' in args.groups:
+            results.update(bench_database(database, rows, users,
+                                          args.repeats))
+        if 'handler' in args.groups:
+            results.update(asyncio.run(
+                bench_handlers(url, api_url, rows, args.repeats)))
+        database.engine.dispose()
+    server.shutdown()
+
+    for name, value in results.items():
+        print(f'{name:45} p50={value["p50_ms"]:9.3f} ms '
+              f'p99={value["p99_ms"]:9.3f} ms')
+    with open(args.out, 'w') as file:
+        json.dump({'meta': metadata(args), 'results': results}, file,
+                  indent=2, ensure_ascii=False)
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""Нагрузочный генератор для бота в режиме webhook.
+
+Запускает `python main.py` с BOT_MODE=webhook против локального mock Bot
+API, шлёт синтетические обновления на webhook и считает updates/sec и
+задержку от POST обновления до ответа бота (sendMessage в mock).
+
+    python -m benchmarks.webhook_load --updates 2000 --concurrency 100
+"""
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.mock_bot_api import start_mock_server
+
+SECRET = 'bench-secret'
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def make_update(update_id, command):
+    chat = {'id': update_id, 'type': 'private'}
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': chat,
+            'from': {'id': update_id, 'is_bot': False, 'first_name': 'u'},
+            'text': command,
+            'entities': [{'type': 'bot_command', 'offset': 0,
+                          'length': len(command.split()[0])}],
+        },
+    }
+
+
+def start_bot(api_url, port, workdir):
+    env = dict(
+        os.environ,
+        BOT_MODE='webhook',
+        WEBHOOK_LISTEN='127.0.0.1',
+        WEBHOOK_PORT=str(port),
+        WEBHOOK_URL=f'http://127.0.0.1:{port}',
+        WEBHOOK_SECRET=SECRET,
+        TELEGRAM_TOKEN='1:bench',
+        TELEGRAM_API_URL=api_url,
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        BOT_LOG_FILE_PATH=os.path.join(workdir, 'bot.log'),
+        LOG_LEVEL='INFO',
+    )
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return subprocess.Popen([sys.executable, 'main.py'], cwd=root, env=env,
+                            stdout=subprocess.DEVNULL)
+
+
+async def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            _, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError('Бот не открыл порт webhook')
+
+
+async def run(updates, concurrency, command):
+    server, api_url = start_mock_server()
+    port = free_port()
+    bot = start_bot(api_url, port, tempfile.mkdtemp())
+    try:
+        await wait_for_port(port)
+        url = f'http://127.0.0.1:{port}/telegram'
+        headers = {'X-Telegram-Bot-Api-Secret-Token': SECRET}
+        sent_at = {}
+        semaphore = asyncio.Semaphore(concurrency)
+        limits = httpx.Limits(max_connections=concurrency)
+        async with httpx.AsyncClient(limits=limits) as client:
+            async def post(update_id):
+                async with semaphore:
+                    sent_at[update_id] = time.monotonic()
+                    await client.post(url, headers=headers,
+                                      json=make_update(update_id, command))
+
+            started = time.monotonic()
+            await asyncio.gather(*(post(i) for i in range(1, updates + 1)))
+            posted = time.monotonic() - started
+
+        replies = {}
+        deadline = time.monotonic() + 60
+        while len(replies) < updates and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+            with server.lock:
+                events = list(server.events)
+            replies = {int(payload['chat_id']): at
+                       for at, method, payload in events
+                       if method == 'sendMessage'}
+        finished = max(replies.values(), default=started) - started
+    finally:
+        bot.send_signal(signal.SIGTERM)
+        bot.wait(timeout=30)
+        server.shutdown()
+
+    latencies = sorted(replies[i] - sent_at[i] for i in replies)
+    p50 = latencies[len(latencies) // 2] if latencies else 0
+    p99 = latencies[max(int(len(latencies) * 0.99) - 1, 0)] if latencies \
+        else 0
+    print(f'{command!r}: ответов {len(replies)}/{updates}, '
+          f'приём {updates / posted:.0f} upd/s, '
+          f'обработка {len(replies) / finished:.0f} upd/s, '
+          f'p50={p50 * 1000:.0f}ms p99={p99 * 1000:.0f}ms')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--updates', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--command', default='/list')
+    args = parser.parse_args()
+    asyncio.run(run(args.updates, args.concurrency, args.command))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,26 +1,121 @@
+import functools
 from datetime import datetime
+from typing import Optional, Union
 
-from telegram import Update
-from telegram.ext import Application, CommandHandler, ContextTypes
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram.ext import (Application, CallbackQueryHandler, CommandHandler,
+                          ContextTypes)
 
-from config import LOG_PATCH
-from core.core import extract_datetime
+from config import (BOT_MODE, LOG_PATCH, METRICS_PORT, WEBHOOK_LISTEN,
+                    WEBHOOK_PATH, WEBHOOK_PORT, WEBHOOK_SECRET, WEBHOOK_URL)
+from core.admission import OVERLOADED, AdmissionControl, Coalescer
+from core.core import HealthChecker, start_status_server
+from core.delivery import split_lines
 from core.logger import OvayLogger
-from database.db import Database
+from core.metrics import observe_handler
+from core.parser import FORMATS_HINT, parse_task
+from core.reminders import local_now
+from database.async_db import AsyncDatabase, ThreadedDatabase
 
 logger = OvayLogger(
     name='bot_logger', log_file_path=LOG_PATCH
 ).get_logger()
 
+# Ключ (deadline, id) в callback_data: Telegram ограничивает её 64 байтами.
+PAGE_CURSOR_FORMAT = '%Y%m%d%H%M%S'
+# 10 задач по 350 символов укладываются в лимит сообщения в 4096. Так же
+# обрезаются описания в ответах /add, /complete и /delete; длинные
+# массовые ответы делятся на несколько сообщений.
+LIST_DESCRIPTION_LIMIT = 350
+# Сколько задач можно добавить, завершить или удалить одной командой.
+MAX_BULK_TASKS = 50
+# Какие типы обновлений нужны каждому виду обработчиков.
+HANDLER_UPDATE_TYPES = {
+    CommandHandler: [Update.MESSAGE],
+    CallbackQueryHandler: [Update.CALLBACK_QUERY],
+}
+REJECT_MESSAGES = {
+    OVERLOADED: '🟧Бот перегружен, повторите команду чуть позже.',
+}
+THROTTLED_MESSAGE = '🟧Слишком много команд подряд, подождите немного.'
+
+
+def admitted(callback):
+    """Пропускает обработчик через TaskBot.admission.
+
+    Отклонённое обновление получает короткий ответ (не чаще
+    REJECT_NOTICE_INTERVAL на пользователя) и до базы не доходит.
+    Декоратор внешний относительно observe_handler: мгновенные отказы не
+    размывают гистограмму времени обработчиков.
+    """
+    @functools.wraps(callback)
+    async def wrapper(self, update, context):
+        if self.admission is None:
+            return await callback(self, update, context)
+        user_id = update.effective_user.id
+        reason = self.admission.admit(user_id)
+        if reason is None:
+            try:
+                return await callback(self, update, context)
+            finally:
+                self.admission.release()
+        logger.warning('🟧Обновление пользователя %s отклонено: %s',
+                       user_id, reason)
+        await self.reject(update, reason)
+    return wrapper
+
 
 class TaskBot:
-    def __init__(self, application: Application, database: Database):
+    def __init__(self, application: Application,
+                 database: Union[AsyncDatabase, ThreadedDatabase],
+                 health: Optional[HealthChecker] = None,
+                 admission: Optional[AdmissionControl] = None):
         self.database = database
         self.application = application
+        self.health = health
+        self.admission = admission
+        # Одинаковые запросы страниц, пришедшие, пока первый ещё читает
+        # базу, получают его результат.
+        self.page_reads = Coalescer('get_tasks_page')
+        self.status_server = None
+
+    async def reject(self, update: Update, reason: str) -> None:
+        message = REJECT_MESSAGES.get(reason, THROTTLED_MESSAGE)
+        notify = self.admission.should_notify(update.effective_user.id)
+        if update.callback_query is not None:
+            # На callback нужно ответить в любом случае, иначе у кнопки
+            # крутится индикатор загрузки.
+            await update.callback_query.answer(message if notify else None)
+        elif notify and update.message is not None:
+            await update.message.reply_text(message)
 
+    async def reply_lines(self, message, lines):
+        """Отвечает строками lines, деля их по лимиту длины сообщения."""
+        for part in split_lines(lines):
+            await message.reply_text(part)
+
+    def get_tasks_page(self, user_id, after=None, before=None):
+        """Страница задач; одинаковые запросы в полёте склеиваются.
+
+        В ключе — поколение кэша пользователя: запрос после записи не
+        присоединится к чтению, начатому до неё, и не покажет старый
+        список. Без кэша поколений нет, и запросы не склеиваются.
+        """
+        def read():
+            return self.database.get_tasks_page(user_id, after=after,
+                                                before=before)
+
+        cache = self.database.cache
+        if cache is None:
+            return read()
+        return self.page_reads.run(
+            (user_id, cache.generation(user_id), after, before), read)
+
+    @admitted
+    @observe_handler
     async def start(self, update: Update,
                     context: ContextTypes.DEFAULT_TYPE) -> None:
-        logger.debug(f'Запущена команда /start')
+        logger.debug('Запущена команда /start')
         user = update.effective_user
         await update.message.reply_text(
             f'Привет, {user.first_name}! Используй команды /add, /list,'
@@ -29,122 +124,284 @@ class TaskBot:
 
     def validate_add_command(self, args):
         if len(args) < 1:
-            return False, ('Используй команду в формате: /add'
-                           ' Описание DD-MM-YYYY-HH-MM')
+            return False, (f'Используй команду в формате: /add '
+                           f'{FORMATS_HINT}')
         return True, None
 
-    def validate_date(self, input_text):
-        date_str = extract_datetime(input_text)
-        if not date_str:
-            return False, ('🟧Даты не найдены. Проверьте формат:'
-                           ' "текст DD-MM-YYYY-HH-MM"')
-        return True, date_str
+    def parse_add_lines(self, text):
+        """Разбирает /add: одна задача на строку "текст срок".
+
+        Возвращает [(description, deadline)] и сообщения об ошибочных
+        строках, чтобы корректные строки добавились одним запросом.
+        """
+        parts = text.split(maxsplit=1)
+        lines = [line.strip() for line in
+                 (parts[1].splitlines() if len(parts) > 1 else [])]
+        now = local_now()
+        tasks, errors = [], []
+        for number, line in enumerate(filter(None, lines), 1):
+            try:
+                tasks.append(parse_task(line, now))
+            except ValueError as e:
+                errors.append(f'Строка {number}: {e}')
+        return tasks, errors
 
+    @admitted
+    @observe_handler
     async def add_task(self, update: Update,
                        context: ContextTypes.DEFAULT_TYPE) -> None:
-        logger.debug(f'Запущена команда /add с аргументами: {context.args}')
-        try:
-            valid, message = self.validate_add_command(context.args)
-            if not valid:
-                await update.message.reply_text(message)
-                return
-
-            input_text = ' '.join(context.args)
-            valid, date_str_or_message = self.validate_date(input_text)
-            if not valid:
-                await update.message.reply_text(date_str_or_message)
-                return
-
-            description = input_text.replace(date_str_or_message,
-                                             '').strip()
-            deadline = datetime.strptime(date_str_or_message,
-                                         '%d-%m-%Y-%H-%M')
-
-            logger.info(f'Добавление задачи: {description},'
-                        f' срок: {deadline}')
-            task = self.database.add_task(description, deadline,
-                                          update.effective_user.id)
-
-            if task:
-                logger.info(f'🟩Задача успешно создана: {task}')
-                await update.message.reply_text(
-                    f'🟩Задача успешно создана:\nОписание: {task.description}\n'
-                    f'Дата выполнения:'
-                    f' {task.deadline.strftime("%d-%m-%Y %H:%M")}'
-                )
-            else:
-                logger.error('🟥Не удалось создать задачу.')
-                await update.message.reply_text('🟥Произошла ошибка при '
-                                                'добавлении задачи.')
+        logger.debug('Запущена команда /add с аргументами: %s', context.args)
+        valid, message = self.validate_add_command(context.args)
+        if not valid:
+            await update.message.reply_text(message)
+            return
+
+        parsed, errors = self.parse_add_lines(update.message.text)
+        if len(parsed) + len(errors) > MAX_BULK_TASKS:
+            await update.message.reply_text(
+                f'🟧За раз можно добавить не больше {MAX_BULK_TASKS} '
+                f'задач.')
+            return
+        if not parsed:
+            await self.reply_lines(update.message, errors)
+            return
 
+        user_id = update.effective_user.id
+        logger.info('Добавление задач пользователя %s: %d',
+                    user_id, len(parsed))
+        # Ошибка ответа ниже не должна выглядеть как ошибка вставки:
+        # задачи уже добавлены, и повтор команды создал бы дубликаты.
+        try:
+            tasks = await self.database.add_tasks(
+                [(description, deadline, user_id)
+                 for description, deadline in parsed])
         except Exception as e:
             logger.error(f'🟥Ошибка при добавлении задачи: {e}')
+            tasks = None
+        if not tasks:
+            logger.error('🟥Не удалось создать задачу.')
             await update.message.reply_text('🟥Произошла ошибка при '
                                             'добавлении задачи.')
+            return
 
-    def validate_task_id(self, args):
+        if len(tasks) == 1 and not errors:
+            task = tasks[0]
+            logger.info('🟩Задача успешно создана: %s', task)
+            await update.message.reply_text(
+                f'🟩Задача успешно создана:\nОписание: '
+                f'{task.description[:LIST_DESCRIPTION_LIMIT]}\n'
+                f'Дата выполнения:'
+                f' {task.deadline.strftime("%d-%m-%Y %H:%M")}'
+            )
+        else:
+            logger.info('🟩Задачи успешно созданы: %d', len(tasks))
+            await self.reply_lines(update.message, [
+                f'🟩Создано задач: {len(tasks)}'] + [
+                f'{task.id}. {task.description[:LIST_DESCRIPTION_LIMIT]} - '
+                f'{task.deadline.strftime("%d-%m-%Y %H:%M")}'
+                for task in tasks] + errors)
+
+    def validate_task_ids(self, args, command):
+        """id задач из аргументов: "/complete 1 2 3" или "/complete 1,2,3"."""
         try:
-            task_id = int(args[0])
-            return True, task_id
-        except (IndexError, ValueError):
-            return False, 'Используй команду в формате: /complete task_id'
+            task_ids = [int(part) for arg in args
+                        for part in arg.split(',') if part]
+        except ValueError:
+            task_ids = []
+        if not task_ids:
+            return False, (f'Используй команду в формате: /{command} '
+                           f'task_id [task_id ...]')
+        if len(task_ids) > MAX_BULK_TASKS:
+            return False, (f'🟧За раз можно указать не больше '
+                           f'{MAX_BULK_TASKS} задач.')
+        return True, list(dict.fromkeys(task_ids))
+
+    def format_bulk_result(self, task_ids, done, title):
+        """Строки ответа на массовые /complete и /delete."""
+        found = {task_id for task_id, _ in done}
+        missing = [str(task_id) for task_id in task_ids
+                   if task_id not in found]
+        lines = [title] + [
+            f'{task_id}. {description[:LIST_DESCRIPTION_LIMIT]}'
+            for task_id, description in done]
+        if missing:
+            lines.append(f'Не найдены: {", ".join(missing)}')
+        return lines
 
+    @admitted
+    @observe_handler
     async def complete_task(self, update: Update,
                             context: ContextTypes.DEFAULT_TYPE) -> None:
-        logger.debug(f'Запущена команда /complete')
-        valid, result = self.validate_task_id(context.args)
+        logger.debug('Запущена команда /complete')
+        valid, result = self.validate_task_ids(context.args, 'complete')
         if not valid:
             await update.message.reply_text(result)
             return
 
-        task_description = self.database.complete_task(result)
-        if task_description:
+        completed = await self.database.complete_tasks(
+            result, update.effective_user.id)
+        if not completed:
+            await update.message.reply_text('Задача не найдена.')
+        elif len(result) == 1:
             await update.message.reply_text(
-                f'Задача "{task_description}" отмечена как выполненная.')
+                f'Задача "{completed[0].description[:LIST_DESCRIPTION_LIMIT]}"'
+                f' отмечена как выполненная.')
         else:
-            await update.message.reply_text('Задача не найдена.')
+            await self.reply_lines(update.message, self.format_bulk_result(
+                result, completed, 'Отмечены как выполненные:'))
 
+    @admitted
+    @observe_handler
     async def delete_task(self, update: Update,
                           context: ContextTypes.DEFAULT_TYPE) -> None:
-        logger.debug(f'Запущена команда /delete')
-        valid, result = self.validate_task_id(context.args)
+        logger.debug('Запущена команда /delete')
+        valid, result = self.validate_task_ids(context.args, 'delete')
         if not valid:
             await update.message.reply_text(result)
             return
 
-        task = self.database.delete_task(result)
-        if task:
-            await update.message.reply_text(f'🟩Задача "{task.description}"'
-                                            f' удалена.')
-        else:
+        deleted = await self.database.delete_tasks(
+            result, update.effective_user.id)
+        if not deleted:
             await update.message.reply_text('Задача не найдена.')
+        elif len(result) == 1:
+            await update.message.reply_text(
+                f'🟩Задача "{deleted[0].description[:LIST_DESCRIPTION_LIMIT]}"'
+                f' удалена.')
+        else:
+            await self.reply_lines(update.message, self.format_bulk_result(
+                result, deleted, '🟩Удалены:'))
+
+    def format_tasks_page(self, tasks, has_prev, has_next):
+        """Текст страницы и клавиатура prev/next с ключами keyset-курсора."""
+        message = 'Ваши задачи:\n' + '\n'.join([
+            f'{task.id}. {task.description[:LIST_DESCRIPTION_LIMIT]} - '
+            f'{task.deadline.strftime("%d-%m-%Y %H:%M")}'
+            for task in tasks
+        ])
+        buttons = []
+        if has_prev:
+            buttons.append(InlineKeyboardButton(
+                '⬅️', callback_data=self.page_callback('prev', tasks[0])))
+        if has_next:
+            buttons.append(InlineKeyboardButton(
+                '➡️', callback_data=self.page_callback('next', tasks[-1])))
+        markup = InlineKeyboardMarkup([buttons]) if buttons else None
+        return message, markup
+
+    def page_callback(self, direction, task):
+        return (f'list:{direction}:'
+                f'{task.deadline.strftime(PAGE_CURSOR_FORMAT)}:{task.id}')
 
+    def parse_page_callback(self, data):
+        try:
+            _, direction, deadline, task_id = data.split(':')
+            cursor = (datetime.strptime(deadline, PAGE_CURSOR_FORMAT),
+                      int(task_id))
+        except ValueError:
+            return None, None
+        if direction not in ('prev', 'next'):
+            return None, None
+        return direction, cursor
+
+    @admitted
+    @observe_handler
     async def list_tasks(self, update: Update,
                          context: ContextTypes.DEFAULT_TYPE) -> None:
-        logger.debug(f'Запущена команда /list')
+        logger.debug('Запущена команда /list')
         user_id = update.effective_user.id
-        tasks = self.database.get_tasks(user_id)
-        if tasks:
-            message = 'Ваши задачи:\n' + '\n'.join([
-                f'{task.id}. {task.description} - '
-                f'{task.deadline.strftime("%d-%m-%Y %H:%M")}'
-                for task in tasks
-            ])
+        page = await self.get_tasks_page(user_id)
+        if page and page[0]:
+            tasks, has_next = page
+            message, markup = self.format_tasks_page(tasks, False, has_next)
+            await update.message.reply_text(message, reply_markup=markup)
         else:
-            message = 'У вас нет активных задач.'
-        await update.message.reply_text(message)
+            await update.message.reply_text('У вас нет активных задач.')
 
-    def run(self):
+    @admitted
+    @observe_handler
+    async def list_page(self, update: Update,
+                        context: ContextTypes.DEFAULT_TYPE) -> None:
+        query = update.callback_query
+        await query.answer()
+        direction, cursor = self.parse_page_callback(query.data)
+        if cursor is None:
+            return
+        if direction == 'next':
+            page = await self.get_tasks_page(query.from_user.id,
+                                             after=cursor)
+        else:
+            page = await self.get_tasks_page(query.from_user.id,
+                                             before=cursor)
+        if not page or not page[0]:
+            await query.edit_message_text('У вас нет активных задач.')
+            return
+        tasks, has_more = page
+        if direction == 'next':
+            message, markup = self.format_tasks_page(tasks, True, has_more)
+        else:
+            message, markup = self.format_tasks_page(tasks, has_more, True)
+        await query.edit_message_text(message, reply_markup=markup)
+
+    async def post_init(self, application: Application) -> None:
+        await self.database.init_db()
+        if self.health is not None:
+            self.status_server = start_status_server(METRICS_PORT,
+                                                     self.health)
+
+    async def post_shutdown(self, application: Application) -> None:
+        if self.status_server is not None:
+            self.status_server.stop()
+        if self.health is not None:
+            await self.health.close()
+        await self.database.close()
+
+    def allowed_updates(self):
+        """Типы обновлений, которые разбирают зарегистрированные handlers."""
+        update_types = set()
+        for handlers in self.application.handlers.values():
+            for handler in handlers:
+                update_types.update(HANDLER_UPDATE_TYPES.get(
+                    type(handler), Update.ALL_TYPES))
+        return sorted(update_types)
+
+    def register_handlers(self):
+        self.application.post_init = self.post_init
+        self.application.post_shutdown = self.post_shutdown
         self.application.add_handler(
             CommandHandler('start', self.start))
         self.application.add_handler(
             CommandHandler('add', self.add_task))
         self.application.add_handler(
             CommandHandler('list', self.list_tasks))
+        self.application.add_handler(
+            CallbackQueryHandler(self.list_page, pattern='^list:'))
         self.application.add_handler(
             CommandHandler('complete', self.complete_task))
         self.application.add_handler(
             CommandHandler('delete', self.delete_task))
-        logger.info('Бот запустился')
+
+    def run(self, mode=BOT_MODE):
+        if mode == 'webhook' and not WEBHOOK_URL:
+            # Иначе PTB зарегистрирует в setWebhook адрес вида
+            # https://0.0.0.0:8443/telegram, и обновления не придут.
+            logger.error('🛑BOT_MODE=webhook требует WEBHOOK_URL.')
+            raise ValueError('WEBHOOK_URL не задан для BOT_MODE=webhook')
+        self.register_handlers()
+        allowed_updates = self.allowed_updates()
+        logger.info('Бот запустился в режиме %s, обновления: %s',
+                    mode, allowed_updates)
         print('Бот запустился')
-        self.application.run_polling(allowed_updates=Update.ALL_TYPES)
+        # SIGINT/SIGTERM останавливают приём обновлений, дожидаются уже
+        # начатых обработчиков и вызывают post_shutdown.
+        if mode == 'webhook':
+            self.application.run_webhook(
+                listen=WEBHOOK_LISTEN,
+                port=WEBHOOK_PORT,
+                url_path=WEBHOOK_PATH,
+                webhook_url=f'{WEBHOOK_URL}/{WEBHOOK_PATH}',
+                secret_token=WEBHOOK_SECRET,
+                allowed_updates=allowed_updates,
+            )
+        else:
+            self.application.run_polling(allowed_updates=allowed_updates)
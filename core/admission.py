@@ -0,0 +1,104 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+from core.delivery import TokenBucket
+from core.metrics import ADMISSION_REJECTED, COALESCED, HANDLERS_IN_FLIGHT
+
+# Как часто один пользователь получает ответ об отказе: остальные отказы
+# молча отбрасываются, иначе спам удваивается нашими же ответами.
+REJECT_NOTICE_INTERVAL = 10
+USER_REJECTED = 'user'
+OVERLOADED = 'overload'
+
+
+class AdmissionControl:
+    """Допуск обновлений в обработчики TaskBot.
+
+    У каждого пользователя свой TokenBucket (burst команд подряд, дальше
+    rate в секунду), а одновременно выполняется не больше max_in_flight
+    обработчиков. Решение принимается без ожидания: отклонённое
+    обновление не занимает базу и не ждёт в очереди. Корзины хранятся
+    LRU на max_users пользователей, как и время последнего ответа об
+    отказе.
+    """
+
+    def __init__(self, rate, burst, max_in_flight, max_users=10000,
+                 notice_interval=REJECT_NOTICE_INTERVAL):
+        self.rate = rate
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self.max_users = max_users
+        self.notice_interval = notice_interval
+        self.buckets = OrderedDict()
+        self.notified = OrderedDict()
+        self.in_flight = 0
+
+    def _bucket(self, user_id):
+        bucket = self.buckets.get(user_id)
+        if bucket is None:
+            bucket = self.buckets[user_id] = TokenBucket(self.rate,
+                                                         self.burst)
+            if len(self.buckets) > self.max_users:
+                evicted, _ = self.buckets.popitem(last=False)
+                self.notified.pop(evicted, None)
+        else:
+            self.buckets.move_to_end(user_id)
+        return bucket
+
+    def admit(self, user_id):
+        """None, если обновление допущено, иначе причина отказа.
+
+        Допущенное обновление нужно завершить вызовом release().
+        """
+        if self.in_flight >= self.max_in_flight:
+            reason = OVERLOADED
+        elif self._bucket(user_id).try_acquire():
+            reason = USER_REJECTED
+        else:
+            self.in_flight += 1
+            HANDLERS_IN_FLIGHT.inc()
+            return None
+        ADMISSION_REJECTED.labels(reason).inc()
+        return reason
+
+    def release(self):
+        self.in_flight -= 1
+        HANDLERS_IN_FLIGHT.dec()
+
+    def should_notify(self, user_id):
+        """Отвечать ли на отказ: не чаще раза в notice_interval."""
+        now = time.monotonic()
+        if now - self.notified.get(user_id, -self.notice_interval) < \
+                self.notice_interval:
+            return False
+        self.notified[user_id] = now
+        self.notified.move_to_end(user_id)
+        if len(self.notified) > self.max_users:
+            self.notified.popitem(last=False)
+        return True
+
+
+class Coalescer:
+    """Один вызов на ключ, пока он выполняется.
+
+    Одинаковые запросы, пришедшие до завершения первого, ждут его
+    результат вместо собственного запроса к базе. Результат общий, так
+    что вызывающие не должны его менять.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.pending = {}
+
+    async def run(self, key, factory):
+        future = self.pending.get(key)
+        if future is not None:
+            COALESCED.labels(self.name).inc()
+            return await asyncio.shield(future)
+        future = asyncio.ensure_future(factory())
+        self.pending[key] = future
+        future.add_done_callback(lambda _: self.pending.pop(key, None))
+        # shield: отмена одного ожидающего не отменяет чтение для
+        # остальных.
+        return await asyncio.shield(future)
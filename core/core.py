@@ -1,49 +1,180 @@
-import re
-import subprocess
+import asyncio
+import time
 
-import redis
-from sqlalchemy import create_engine
+import httpx
+import redis.asyncio as aioredis
+import tornado.web
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from config import (CELERY_BROKER_URL, FLOWER_URL, HEALTH_CACHE_TTL,
+                    HEALTH_TIMEOUT, LOG_PATCH, REDIS_BROKER_URL)
+from core.logger import OvayLogger
+from core.parser import find_deadline
+
+logger = OvayLogger(
+    name='health_logger', log_file_path=LOG_PATCH
+).get_logger()
+
+
+# Без этих зависимостей бот не обслуживает обновления: /livez проверяет
+# только их, /healthz — все, включая Celery и Flower.
+LIVENESS_CHECKS = ('database', 'redis')
 
 
 def extract_datetime(text: str):
-    pattern = r'\d{2}-\d{2}-\d{4}-\d{2}-\d{2}'
-    result = re.findall(pattern, text)
-    return result[0] if result else None
-
-
-def check_database():
-    try:
-        engine = create_engine("sqlite:///tasks.db")
-        connection = engine.connect()
-        connection.close()
-        return True
-    except Exception:
-        return False
-
-
-def check_redis():
-    try:
-        r = redis.Redis(host='redis', port=6379, db=0)
-        r.ping()
-        return True
-    except Exception:
-        return False
-
-
-def check_celery():
-    try:
-        result = subprocess.run(
-            ['pgrep', '-f', 'celery'],
-            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        return result.stdout.strip() != b''
-    except Exception:
-        return False
-
-
-def check_flower():
-    try:
-        result = subprocess.run(['curl', '-Is', 'http://flower:5555'],
-                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        return result.returncode == 0
-    except Exception:
-        return False
\ No newline at end of file
+    match = find_deadline(text)
+    return match.group(0) if match else None
+
+
+def _ping_engine(engine):
+    with engine.connect() as connection:
+        connection.execute(text('SELECT 1'))
+
+
+async def check_database(engine):
+    """SELECT 1 через общий пул engine приложения (sync или async)."""
+    if isinstance(engine, AsyncEngine):
+        async with engine.connect() as connection:
+            await connection.execute(text('SELECT 1'))
+    else:
+        await asyncio.to_thread(_ping_engine, engine)
+    return True
+
+
+async def check_redis(redis_client):
+    return bool(await redis_client.ping())
+
+
+async def check_celery(celery_app, timeout):
+    """inspect ping через брокер: жив хотя бы один воркер."""
+    replies = await asyncio.to_thread(celery_app.control.ping,
+                                      timeout=timeout)
+    return bool(replies)
+
+
+async def check_flower(http_client, url):
+    response = await http_client.get(f'{url}/healthcheck')
+    return response.status_code == 200
+
+
+class HealthChecker:
+    """Проверки зависимостей для /healthz без подпроцессов.
+
+    Использует общий engine приложения, пул соединений Redis и один
+    httpx.AsyncClient; проверки идут параллельно, каждая со своим
+    таймаутом, а результат кэшируется на ttl секунд, так что частые
+    liveness-пробы не нагружают зависимости.
+    """
+
+    def __init__(self, engine, redis_url=REDIS_BROKER_URL,
+                 flower_url=FLOWER_URL, ttl=HEALTH_CACHE_TTL,
+                 timeout=HEALTH_TIMEOUT, broker_url=CELERY_BROKER_URL):
+        self.engine = engine
+        self.flower_url = flower_url
+        self.ttl = ttl
+        self.timeout = timeout
+        self.redis = aioredis.Redis.from_url(
+            redis_url, socket_timeout=timeout,
+            socket_connect_timeout=timeout)
+        self.broker_url = broker_url
+        self._celery_app = None
+        self.http_client = httpx.AsyncClient(timeout=timeout)
+        self.locks = {}
+        self.cached = {}
+
+    @property
+    def celery_app(self):
+        # celery (~0.1 с импорта) нужен только проверке, а не старту бота.
+        if self._celery_app is None:
+            from celery import Celery
+
+            self._celery_app = Celery(broker=self.broker_url)
+            # Без этого ping к недоступному брокеру повторяет публикацию
+            # ~6 с.
+            self._celery_app.conf.broker_transport_options = {
+                'max_retries': 0}
+        return self._celery_app
+
+    def checks(self):
+        """Фабрики проверок по имени: корутины создаются только для нужных."""
+        return {
+            'database': lambda: check_database(self.engine),
+            'redis': lambda: check_redis(self.redis),
+            'celery': lambda: check_celery(self.celery_app, self.timeout),
+            'flower': lambda: check_flower(self.http_client,
+                                           self.flower_url),
+        }
+
+    async def _run(self, name, check):
+        try:
+            return await asyncio.wait_for(check, self.timeout * 2)
+        except Exception as e:
+            logger.warning(f'🟧Проверка {name} не прошла: {e!r}')
+            return False
+
+    async def check(self, names=None):
+        """{'ok': bool, 'checks': {имя: bool}}, не чаще раза в ttl.
+
+        names — какие проверки выполнить (по умолчанию все); у каждого
+        набора свой кэш и своя блокировка, так что медленная проверка
+        Celery в /healthz не задерживает /livez.
+        """
+        factories = self.checks()
+        names = tuple(names or factories)
+        async with self.locks.setdefault(names, asyncio.Lock()):
+            expires, result = self.cached.get(names, (0, None))
+            if result is not None and time.monotonic() < expires:
+                return result
+            results = await asyncio.gather(
+                *(self._run(name, factories[name]()) for name in names))
+            statuses = dict(zip(names, results))
+            result = {'ok': all(statuses.values()), 'checks': statuses}
+            self.cached[names] = (time.monotonic() + self.ttl, result)
+            return result
+
+    async def close(self):
+        await self.http_client.aclose()
+        await self.redis.aclose()
+
+
+class HealthzHandler(tornado.web.RequestHandler):
+    """Отчёт по проверкам names (None — все); 503, если какая-то упала."""
+
+    def initialize(self, checker, names=None):
+        self.checker = checker
+        self.names = names
+
+    async def get(self):
+        result = await self.checker.check(self.names)
+        self.set_status(200 if result['ok'] else 503)
+        self.write(result)
+
+
+class MetricsHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.set_header('Content-Type', CONTENT_TYPE_LATEST)
+        self.write(generate_latest())
+
+
+def start_status_server(port, checker):
+    """/healthz, /livez и /metrics процесса бота в его event loop.
+
+    /livez — проба живости самого бота (база и Redis), /healthz — отчёт
+    о готовности всех зависимостей. port 0 выключает сервер.
+
+    Вызывается из запущенного loop (post_init); возвращает HTTPServer
+    для остановки или None.
+    """
+    if not port:
+        return None
+    application = tornado.web.Application([
+        (r'/healthz', HealthzHandler, {'checker': checker}),
+        (r'/livez', HealthzHandler, {'checker': checker,
+                                     'names': LIVENESS_CHECKS}),
+        (r'/metrics', MetricsHandler),
+    ])
+    server = application.listen(port)
+    logger.info('/healthz, /livez и /metrics доступны на :%d', port)
+    return server
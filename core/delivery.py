@@ -0,0 +1,411 @@
+import asyncio
+import calendar
+import json
+import time
+import uuid
+
+import httpx
+
+from config import (DELIVERY_BATCH_SIZE, DELIVERY_CONCURRENCY,
+                    DELIVERY_LOCK_TTL, DELIVERY_MAX_ATTEMPTS, LOG_PATCH,
+                    REMINDER_DIGEST_WINDOW, REMINDER_SENT_TTL,
+                    TELEGRAM_API_URL, TELEGRAM_CHAT_RATE,
+                    TELEGRAM_GLOBAL_RATE, TELEGRAM_TOKEN)
+from core.logger import OvayLogger
+from core.metrics import (DIGEST_SIZE, TELEGRAM_ERRORS, TELEGRAM_RETRIES,
+                          TELEGRAM_SEND_SECONDS, TELEGRAM_SENT)
+
+logger = OvayLogger(
+    name='delivery_logger', log_file_path=LOG_PATCH
+).get_logger()
+
+OUTBOX_KEY = 'reminders:outbox'
+SENT_KEY = 'reminders:sent'
+# Пользователи с накопленным дайджестом (score — когда отправлять) и
+# списки текстов напоминаний каждого из них.
+DIGESTS_KEY = 'reminders:digests'
+DIGEST_KEY_PREFIX = 'reminders:digest:'
+# Блокировка разбора outbox: лимиты Telegram считают TokenBucket внутри
+# TelegramSender, поэтому отправлять должен один процесс за раз.
+DRAIN_LOCK_KEY = 'reminders:drain-lock'
+# Лимит Telegram на длину одного сообщения.
+MESSAGE_LIMIT = 4096
+MESSAGE_PREFIX = 'Напоминание '
+# Шаг score между сообщениями, возвращёнными в outbox одним разбором.
+REQUEUE_STEP = 0.001
+
+
+class TokenBucket:
+    """Token bucket: rate токенов в секунду, не больше capacity."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity,
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self):
+        """Забирает токен; возвращает 0 или сколько секунд ждать до токена."""
+        now = time.monotonic()
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    async def acquire(self):
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+
+def _outbox_message(chat_id, text, attempt=0):
+    return json.dumps({'id': uuid.uuid4().hex, 'chat_id': chat_id,
+                       'text': text, 'attempt': attempt},
+                      ensure_ascii=False)
+
+
+def enqueue_reminder(redis_client, chat_id, text, delay=0, attempt=0):
+    """Кладёт сообщение в outbox; score — unix-время, когда его можно слать."""
+    redis_client.zadd(OUTBOX_KEY, {_outbox_message(chat_id, text, attempt):
+                                   time.time() + delay})
+
+
+# Проверка журнала, запись в него и постановка в дайджест пользователя
+# одной операцией: между ними не может упасть воркер или вклиниться второй
+# шард. Пользователь попадает в DIGESTS_KEY один раз за окно группировки.
+ENQUEUE_ONCE_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[3])
+if redis.call('ZADD', KEYS[1], 'NX', ARGV[2], ARGV[1]) == 0 then
+    return 0
+end
+redis.call('RPUSH', KEYS[3], ARGV[6])
+redis.call('ZADD', KEYS[2], 'NX', ARGV[4], ARGV[5])
+return 1
+"""
+
+# Забирает накопленный дайджест: его получает только тот, чей ZREM удался.
+POP_DIGEST_SCRIPT = """
+if redis.call('ZREM', KEYS[1], ARGV[1]) == 0 then
+    return {}
+end
+local items = redis.call('LRANGE', KEYS[2], 0, -1)
+redis.call('DEL', KEYS[2])
+return items
+"""
+
+
+# Продление и снятие блокировки — только владельцем, чей токен в ключе.
+RENEW_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def _digest_key(chat_id):
+    return f'{DIGEST_KEY_PREFIX}{chat_id}'
+
+
+def enqueue_reminders_once(redis_client, reminders, ttl=REMINDER_SENT_TTL,
+                           window=REMINDER_DIGEST_WINDOW):
+    """Добавляет каждое напоминание пачки в дайджест пользователя ровно раз.
+
+    reminders — [(task_id, slot, chat_id, text)]. Журнал SENT_KEY — sorted
+    set из «задача:слот» со score, равным времени слота; записи старше ttl
+    вычищаются тем же скриптом. Повторный или опоздавший тик,
+    перезапущенный шард и второй воркер видят слот в журнале и ничего не
+    добавляют. Дайджест уходит одним сообщением через window секунд после
+    первого напоминания в нём. Вся пачка уходит в Redis одним pipeline;
+    возвращает [bool] — добавлено ли каждое напоминание.
+    """
+    now = time.time()
+    pipe = redis_client.pipeline(transaction=False)
+    for task_id, slot, chat_id, text in reminders:
+        pipe.eval(ENQUEUE_ONCE_SCRIPT, 3, SENT_KEY, DIGESTS_KEY,
+                  _digest_key(chat_id), f'{task_id}:{slot:%Y%m%d%H%M}',
+                  calendar.timegm(slot.utctimetuple()), now - ttl,
+                  now + window, chat_id, text)
+    return [bool(added) for added in pipe.execute()]
+
+
+def split_lines(lines, limit=MESSAGE_LIMIT, header=None, separator='\n'):
+    """Строки -> сообщения не длиннее limit, без разрыва строк.
+
+    header, если задан, начинает каждое сообщение; строка, которая не
+    помещается в сообщение целиком, обрезается.
+    """
+    room = limit
+    if header is not None:
+        room -= len(header) + len(separator)
+    parts, current = [], header
+    for line in lines:
+        line = line[:room]
+        if current is None:
+            current = line
+        elif len(current) + len(separator) + len(line) > limit:
+            parts.append(current)
+            current = line if header is None else header + separator + line
+        else:
+            current += separator + line
+    if current is not None:
+        parts.append(current)
+    return parts
+
+
+def split_digest(texts, limit=MESSAGE_LIMIT - len(MESSAGE_PREFIX)):
+    """Тексты напоминаний одного пользователя -> сообщения не длиннее limit.
+
+    Одно напоминание уходит как есть, несколько — под заголовком с их
+    числом; напоминание длиннее limit обрезается.
+    """
+    if len(texts) == 1:
+        return [texts[0][:limit]]
+    return split_lines(texts, limit, header=f'о задачах ({len(texts)}):',
+                       separator='\n\n')
+
+
+def pop_due_digests(redis_client, size=DELIVERY_BATCH_SIZE):
+    """Забирает до size наступивших дайджестов как сообщения outbox."""
+    chat_ids = redis_client.zrangebyscore(
+        DIGESTS_KEY, '-inf', time.time(), start=0, num=size)
+    if not chat_ids:
+        return []
+    pipe = redis_client.pipeline(transaction=False)
+    for chat_id in chat_ids:
+        pipe.eval(POP_DIGEST_SCRIPT, 2, DIGESTS_KEY,
+                  _digest_key(chat_id.decode()), chat_id)
+    messages = []
+    for chat_id, items in zip(chat_ids, pipe.execute()):
+        if not items:
+            continue
+        texts = [item.decode() for item in items]
+        DIGEST_SIZE.observe(len(texts))
+        messages.extend({'id': uuid.uuid4().hex, 'chat_id': int(chat_id),
+                         'text': part, 'attempt': 0}
+                        for part in split_digest(texts))
+    return messages
+
+
+def pop_due_batch(redis_client, size=DELIVERY_BATCH_SIZE):
+    """Забирает из outbox до size наступивших сообщений.
+
+    ZREM возвращает 1 только одному из конкурирующих воркеров, поэтому
+    одно сообщение не уйдёт дважды.
+    """
+    candidates = redis_client.zrangebyscore(
+        OUTBOX_KEY, '-inf', time.time(), start=0, num=size)
+    if not candidates:
+        return []
+    pipe = redis_client.pipeline()
+    for member in candidates:
+        pipe.zrem(OUTBOX_KEY, member)
+    claimed = pipe.execute()
+    return [json.loads(member) for member, ok in zip(candidates, claimed)
+            if ok]
+
+
+def retry_after_seconds(response):
+    """Пауза из ответа 429: parameters.retry_after, иначе Retry-After, 1 с.
+
+    Тело 429 от прокси или балансировщика может быть не JSON.
+    """
+    try:
+        return int(response.json()['parameters']['retry_after'])
+    except (ValueError, KeyError, TypeError):
+        pass
+    try:
+        return int(response.headers.get('Retry-After', 1))
+    except ValueError:
+        return 1
+
+
+class TelegramSender:
+    """Отправка сообщений через один keep-alive httpx.AsyncClient.
+
+    Глобальный лимит ожидается асинхронно, а сообщения, упёршиеся в лимит
+    чата или получившие 429, возвращаются вызывающему с задержкой вместо
+    sleep внутри воркера. Исключение — следующие сообщения того же чата в
+    пачке: они ждут лимит чата, чтобы части дайджеста не перемешались.
+    """
+
+    def __init__(self, token=TELEGRAM_TOKEN, api_url=TELEGRAM_API_URL,
+                 concurrency=DELIVERY_CONCURRENCY,
+                 global_rate=TELEGRAM_GLOBAL_RATE,
+                 chat_rate=TELEGRAM_CHAT_RATE):
+        self.url = f'{api_url}/bot{token}/sendMessage'
+        self.concurrency = concurrency
+        self.global_bucket = TokenBucket(global_rate)
+        self.chat_rate = chat_rate
+        self.chat_buckets = {}
+        self.client = None
+
+    async def __aenter__(self):
+        self.client = httpx.AsyncClient(
+            timeout=10,
+            limits=httpx.Limits(max_connections=self.concurrency,
+                                max_keepalive_connections=self.concurrency))
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.client.aclose()
+        self.client = None
+
+    def _chat_bucket(self, chat_id):
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate)
+        return bucket
+
+    async def send(self, message):
+        """Отправляет одно сообщение; лимит чата проверяет send_chat.
+
+        Возвращает None, если сообщение доставлено или окончательно
+        отклонено, иначе (задержка, ошибка_ли) для повторной постановки.
+        """
+        await self.global_bucket.acquire()
+        payload = {'chat_id': message['chat_id'],
+                   'text': MESSAGE_PREFIX + message['text']}
+        started = time.perf_counter()
+        try:
+            response = await self.client.post(self.url, json=payload)
+        except httpx.RequestError as e:
+            TELEGRAM_ERRORS.labels('network').inc()
+            TELEGRAM_RETRIES.labels('network').inc()
+            logger.error(f"Request error for user {message['chat_id']}: {e}")
+            return 2 ** message['attempt'], True
+        finally:
+            TELEGRAM_SEND_SECONDS.observe(time.perf_counter() - started)
+        if response.status_code >= 400:
+            TELEGRAM_ERRORS.labels(str(response.status_code)).inc()
+        if response.status_code == 429:
+            retry_after = retry_after_seconds(response)
+            TELEGRAM_RETRIES.labels('429').inc()
+            logger.warning(f"🟧Telegram 429 для {message['chat_id']}, "
+                           f"повтор через {retry_after} с.")
+            return retry_after, False
+        if response.status_code >= 500:
+            TELEGRAM_RETRIES.labels('5xx').inc()
+            logger.error(f'🛑Telegram {response.status_code} для '
+                         f"{message['chat_id']}")
+            return 2 ** message['attempt'], True
+        if response.status_code >= 400:
+            logger.error(f'🛑Telegram отклонил сообщение для '
+                         f"{message['chat_id']}: {response.text}")
+            return None
+        TELEGRAM_SENT.inc()
+        logger.info('Message sent to user %s', message['chat_id'])
+        return None
+
+    async def _send_guarded(self, message):
+        try:
+            return await self.send(message)
+        except Exception as e:
+            # Сообщение уже снято с outbox: без повтора оно пропало бы
+            # вместе со всей пачкой.
+            TELEGRAM_RETRIES.labels('error').inc()
+            logger.error(f'🛑Ошибка отправки для '
+                         f"{message['chat_id']}: {e!r}")
+            return 2 ** message['attempt'], True
+
+    async def send_chat(self, messages, semaphore):
+        """Сообщения одного чата строго по порядку.
+
+        Первое упирается в лимит чата без ожидания: тогда на повтор уходят
+        все. Следующие ждут лимит здесь же, поэтому части дайджеста уходят
+        одна за другой в этом же разборе. Если сообщение возвращается на
+        повтор, за ним с той же задержкой возвращаются и все следующие.
+        """
+        bucket = self._chat_bucket(messages[0]['chat_id'])
+        wait = bucket.try_acquire()
+        if wait:
+            TELEGRAM_RETRIES.labels('chat_rate').inc()
+            return [(message, (wait, False)) for message in messages]
+        retries = []
+        for index, message in enumerate(messages):
+            if index:
+                await bucket.acquire()
+            async with semaphore:
+                retry = await self._send_guarded(message)
+            if retry is not None:
+                retries.append((message, retry))
+                retries.extend((rest, (retry[0], False))
+                               for rest in messages[index + 1:])
+                break
+        return retries
+
+    async def send_batch(self, messages):
+        """Отправляет пачку; возвращает [(сообщение, (задержка, ошибка))].
+
+        Чаты отправляются параллельно, сообщения одного чата — по порядку
+        пачки. Неожиданное исключение при отправке одного сообщения не
+        роняет пачку: сообщение возвращается на повтор как неудачная
+        попытка. Возвраты идут в порядке пачки внутри каждого чата.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        chats = {}
+        for message in messages:
+            chats.setdefault(message['chat_id'], []).append(message)
+        results = await asyncio.gather(*(self.send_chat(chat, semaphore)
+                                         for chat in chats.values()))
+        return [retry for retries in results for retry in retries]
+
+
+async def drain_outbox(redis_client, sender, time_budget=50,
+                       lock_ttl=DELIVERY_LOCK_TTL):
+    """Разбирает outbox пачками, пока есть сообщения и не вышло время.
+
+    Одновременно работает один разбор на все воркеры: запуск, не
+    получивший блокировку DRAIN_LOCK_KEY (SET NX PX), сразу возвращает 0.
+    Блокировка продлевается перед каждой пачкой; если её успели потерять,
+    разбор останавливается.
+    """
+    token = uuid.uuid4().hex
+    if not redis_client.set(DRAIN_LOCK_KEY, token, nx=True, px=lock_ttl):
+        return 0
+    processed = 0
+    deadline = time.monotonic() + time_budget
+    try:
+        async with sender:
+            while time.monotonic() < deadline:
+                if not redis_client.eval(RENEW_LOCK_SCRIPT, 1,
+                                         DRAIN_LOCK_KEY, token, lock_ttl):
+                    logger.warning('🟧Блокировка outbox потеряна, разбор '
+                                   'остановлен.')
+                    break
+                batch = (pop_due_batch(redis_client) +
+                         pop_due_digests(redis_client))
+                if not batch:
+                    break
+                retries = await sender.send_batch(batch)
+                for index, (message, (delay, failed)) in enumerate(retries):
+                    attempt = message['attempt'] + int(failed)
+                    if attempt >= DELIVERY_MAX_ATTEMPTS:
+                        logger.error(f"🛑Сообщение для {message['chat_id']} "
+                                     f'отброшено после '
+                                     f'{DELIVERY_MAX_ATTEMPTS} попыток.')
+                        continue
+                    # При равной задержке смещение сохраняет в outbox
+                    # порядок возвращённых частей одного чата.
+                    enqueue_reminder(redis_client, message['chat_id'],
+                                     message['text'],
+                                     delay=delay + index * REQUEUE_STEP,
+                                     attempt=attempt)
+                processed += len(batch)
+    finally:
+        redis_client.eval(RELEASE_LOCK_SCRIPT, 1, DRAIN_LOCK_KEY, token)
+    return processed
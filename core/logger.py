@@ -1,45 +1,166 @@
+import atexit
 import logging
 import os
+import queue
+import threading
 from datetime import datetime
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
 import pytz
 
+# Уровень и режим задаются окружением: DEBUG на разработке, INFO в проде.
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'DEBUG').upper()
+# queue — запись в файл в фоновом потоке, sync — прямо в вызывающем.
+LOG_MODE = os.getenv('LOG_MODE', 'queue')
+# Сколько DEBUG-записей с одним шаблоном сообщения пропускать в секунду.
+LOG_DEBUG_RATE = int(os.getenv('LOG_DEBUG_RATE', 20))
+# Часовой пояс времени в строках лога.
+LOG_TIMEZONE = os.getenv('LOG_TIMEZONE', 'Europe/Moscow')
+LOG_FORMAT = ("[%(asctime)s - func:_%(filename)s.%(funcName)s- "
+              "%(levelname)s ]:\n >> %(message)s <<\n ----")
+
+
+class DebugRateLimitFilter(logging.Filter):
+    """Пропускает не больше rate DEBUG-записей в секунду на шаблон.
+
+    Ключ — неотформатированный record.msg, поэтому строки вида
+    'Открываем сессию...' ограничиваются, а остальные уровни не трогаются.
+    Число отброшенных записей копится в suppressed.
+    """
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+        self.second = None
+        self.counts = {}
+        self.suppressed = 0
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or not self.rate:
+            return True
+        second = int(record.created)
+        key = (record.name, record.msg)
+        with self.lock:
+            if second != self.second:
+                self.second, self.counts = second, {}
+            count = self.counts.get(key, 0)
+            if count >= self.rate:
+                self.suppressed += 1
+                return False
+            self.counts[key] = count + 1
+        return True
+
 
 class OvayLogger:
-    def __init__(self, name, log_file_path):
+    # Один файловый обработчик и один фоновый писатель на файл лога,
+    # сколько бы OvayLogger ни было создано в процессе.
+    _formatters = {}
+    _file_handlers = {}
+    _queue_handlers = {}
+    _listeners = {}
+    _lock = threading.Lock()
+
+    def __init__(self, name, log_file_path, level=LOG_LEVEL, mode=LOG_MODE):
         self.logger = logging.getLogger(name)
         self.log_file_path = log_file_path
+        self.level = level
+        self.mode = mode
         self.setup_logging()
 
+    def _file_handler(self):
+        handler = self._file_handlers.get(self.log_file_path)
+        if handler is None:
+            os.makedirs(os.path.dirname(self.log_file_path), exist_ok=True)
+            handler = RotatingFileHandler(
+                self.log_file_path, maxBytes=50000000, backupCount=5
+            )
+            handler.setFormatter(self.formatter(LOG_TIMEZONE))
+            self._file_handlers[self.log_file_path] = handler
+        return handler
+
+    @classmethod
+    def formatter(cls, timezone):
+        """Один OvayFormatter на часовой пояс для всех логгеров процесса."""
+        formatter = cls._formatters.get(timezone)
+        if formatter is None:
+            formatter = cls._formatters[timezone] = cls.OvayFormatter(
+                LOG_FORMAT, timezone=timezone)
+        return formatter
+
+    def _queue_handler(self):
+        handler = self._queue_handlers.get(self.log_file_path)
+        if handler is None:
+            log_queue = queue.SimpleQueue()
+            listener = QueueListener(log_queue, self._file_handler())
+            listener.start()
+            atexit.register(listener.stop)
+            handler = QueueHandler(log_queue)
+            handler.addFilter(DebugRateLimitFilter(LOG_DEBUG_RATE))
+            self._queue_handlers[self.log_file_path] = handler
+            self._listeners[self.log_file_path] = listener
+        return handler
+
     def setup_logging(self):
-        os.makedirs(os.path.dirname(self.log_file_path), exist_ok=True)
-
-        formatter = self.OvayFormatter(
-            "[%(asctime)s - func:_%(filename)s.%(funcName)s- %(levelname)s ]:"
-            "\n >> %(message)s <<\n ----"
-        )
-        self.logger.setLevel(logging.DEBUG)
-        handler = RotatingFileHandler(
-            self.log_file_path, maxBytes=50000000, backupCount=5
-        )
-        handler.setFormatter(formatter)
-        self.logger.addHandler(handler)
+        self.logger.setLevel(self.level)
+        with self._lock:
+            if self.mode == 'queue':
+                handler = self._queue_handler()
+            else:
+                handler = self._file_handler()
+            if handler not in self.logger.handlers:
+                self.logger.addHandler(handler)
+
+    @classmethod
+    def flush(cls):
+        """Дожидается записи всего, что уже лежит в очередях."""
+        for listener in list(cls._listeners.values()):
+            listener.stop()
+            listener.start()
+
+    @classmethod
+    def _restart_after_fork(cls):
+        # В дочернем процессе (prefork Celery) фонового писателя нет:
+        # без нового потока записи копились бы в очереди навсегда.
+        cls._lock = threading.Lock()
+        for path, handler in cls._queue_handlers.items():
+            handler.queue = queue.SimpleQueue()
+            listener = QueueListener(handler.queue, cls._file_handlers[path])
+            listener.start()
+            atexit.register(listener.stop)
+            cls._listeners[path] = listener
 
     class OvayFormatter(logging.Formatter):
+        """Формат времени вида «ПН 01.01.2024 12:00:00» в LOG_TIMEZONE.
+
+        Часовой пояс разрешается один раз, а строка времени кэшируется на
+        текущую секунду: подряд идущие записи её не пересчитывают.
+        """
+        DAYS = ("ПН", "ВТ", "СР", "ЧТ", "ПТ", "СБ", "ВС")
+
+        def __init__(self, fmt=None, datefmt=None, timezone=LOG_TIMEZONE):
+            super().__init__(fmt, datefmt)
+            self.timezone = pytz.timezone(timezone)
+            self._cached = (None, None)
+
         def converter(self, timestamp):
-            dt = datetime.fromtimestamp(timestamp)
-            return dt.astimezone(pytz.timezone("Europe/Moscow"))
+            return datetime.fromtimestamp(timestamp, self.timezone)
 
         def formatTime(self, record, datefmt=None):
-            dt = self.converter(record.created)
-            days = ["ПН", "ВТ", "СР", "ЧТ", "ПТ", "СБ", "ВС"]
-            day_of_week = days[dt.weekday()]
             if datefmt:
-                s = dt.strftime(datefmt)
-            else:
-                s = f"{day_of_week} {dt.strftime('%d.%m.%Y %H:%M:%S')}"
-            return s
+                return self.converter(record.created).strftime(datefmt)
+            second = int(record.created)
+            cached_second, cached = self._cached
+            if cached_second != second:
+                dt = self.converter(second)
+                cached = (f"{self.DAYS[dt.weekday()]} "
+                          f"{dt.strftime('%d.%m.%Y %H:%M:%S')}")
+                self._cached = (second, cached)
+            return cached
 
     def get_logger(self):
-        return self.logger
\ No newline at end of file
+        return self.logger
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=OvayLogger._restart_after_fork)
@@ -0,0 +1,179 @@
+import functools
+import inspect
+import os
+import time
+
+from prometheus_client import (REGISTRY, CollectorRegistry, Counter, Gauge,
+                               Histogram, multiprocess, start_http_server)
+
+from config import LOG_PATCH
+from core.logger import OvayLogger
+
+logger = OvayLogger(
+    name='metrics_logger', log_file_path=LOG_PATCH
+).get_logger()
+
+# В multiprocess-режиме prometheus_client открывает файлы каталога уже
+# при создании метрик ниже, то есть при импорте модуля. Старые файлы
+# удаляет команда запуска воркера: здесь процесс не знает, первый ли он.
+if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+    os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+
+FAST_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1,
+                2.5, 5, 10)
+ROW_BUCKETS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000, 50000)
+
+HANDLER_SECONDS = Histogram(
+    'bot_handler_seconds', 'Время обработчика TaskBot.', ['handler'],
+    buckets=FAST_BUCKETS)
+HANDLER_ERRORS = Counter(
+    'bot_handler_errors_total', 'Исключения в обработчиках TaskBot.',
+    ['handler'])
+
+ADMISSION_REJECTED = Counter(
+    'bot_admission_rejected_total', 'Обновлений, отклонённых допуском.',
+    ['reason'])
+HANDLERS_IN_FLIGHT = Gauge(
+    'bot_handlers_in_flight', 'Допущенных обработчиков в работе.')
+COALESCED = Counter(
+    'bot_coalesced_total', 'Запросов, получивших результат чужого чтения.',
+    ['name'])
+
+DB_QUERY_SECONDS = Histogram(
+    'db_query_seconds', 'Время метода Database/AsyncDatabase.', ['method'],
+    buckets=FAST_BUCKETS)
+DB_ROWS = Histogram(
+    'db_query_rows', 'Строк в результате метода Database.', ['method'],
+    buckets=ROW_BUCKETS)
+
+CACHE_EVENTS = Counter(
+    'task_cache_events_total', 'События кэша задач TaskCache.', ['event'])
+CACHE_USERS = Gauge(
+    'task_cache_users', 'Пользователей в памяти TaskCache.')
+
+REMINDER_SCAN_SECONDS = Histogram(
+    'reminder_scan_seconds', 'Время обхода одного шарда напоминаний.',
+    buckets=FAST_BUCKETS + (30, 60))
+REMINDERS_DUE = Counter(
+    'reminders_due_total', 'Задач с наступившим напоминанием в обходах.')
+REMINDERS_ENQUEUED = Counter(
+    'reminders_enqueued_total', 'Напоминаний добавлено в дайджесты.',
+    ['kind'])
+DIGEST_SIZE = Histogram(
+    'reminder_digest_size', 'Напоминаний в одном дайджесте пользователя.',
+    buckets=ROW_BUCKETS)
+
+TELEGRAM_SEND_SECONDS = Histogram(
+    'telegram_send_seconds', 'Время запроса sendMessage.',
+    buckets=FAST_BUCKETS)
+TELEGRAM_SENT = Counter(
+    'telegram_sent_total', 'Доставленных напоминаний.')
+TELEGRAM_RETRIES = Counter(
+    'telegram_send_retries_total', 'Сообщений, возвращённых в outbox.',
+    ['reason'])
+TELEGRAM_ERRORS = Counter(
+    'telegram_send_errors_total', 'Ошибок Telegram по коду ответа.',
+    ['code'])
+
+CELERY_TASK_SECONDS = Histogram(
+    'celery_task_seconds', 'Время выполнения задачи Celery.', ['task'],
+    buckets=FAST_BUCKETS + (30, 60))
+CELERY_TASKS = Counter(
+    'celery_tasks_total', 'Завершённые задачи Celery по состоянию.',
+    ['task', 'state'])
+
+
+def _row_count(result):
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, tuple) and result and isinstance(result[0], list):
+        # Страница get_tasks_page: (строки, есть_ещё).
+        return len(result[0])
+    return None
+
+
+def _observe_query(name, started, result):
+    DB_QUERY_SECONDS.labels(name).observe(time.perf_counter() - started)
+    rows = _row_count(result)
+    if rows is not None:
+        DB_ROWS.labels(name).observe(rows)
+
+
+def observe_query(method):
+    """Время и число строк метода БД; работает и с корутинами."""
+    name = method.__name__
+    if inspect.iscoroutinefunction(method):
+        @functools.wraps(method)
+        async def async_wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            result = await method(*args, **kwargs)
+            _observe_query(name, started, result)
+            return result
+        return async_wrapper
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        result = method(*args, **kwargs)
+        _observe_query(name, started, result)
+        return result
+    return wrapper
+
+
+def observe_handler(callback):
+    """Гистограмма времени и счётчик исключений обработчика бота."""
+    name = callback.__name__
+
+    @functools.wraps(callback)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await callback(*args, **kwargs)
+        except Exception:
+            HANDLER_ERRORS.labels(name).inc()
+            raise
+        finally:
+            HANDLER_SECONDS.labels(name).observe(
+                time.perf_counter() - started)
+    return wrapper
+
+
+def connect_celery_signals(port):
+    """Метрики воркеров Celery через сигналы.
+
+    Время и итог каждой задачи пишутся в task_prerun/task_postrun. В
+    prefork дочерние процессы пишут значения в PROMETHEUS_MULTIPROC_DIR,
+    а главный процесс воркера отдаёт их сводно на port. Каталог очищается
+    до запуска воркера (см. docker-compose.yml).
+    """
+    from celery import signals
+
+    started = {}
+
+    @signals.task_prerun.connect(weak=False)
+    def task_prerun(task_id=None, **kwargs):
+        started[task_id] = time.perf_counter()
+
+    @signals.task_postrun.connect(weak=False)
+    def task_postrun(task_id=None, task=None, state=None, **kwargs):
+        began = started.pop(task_id, None)
+        if began is not None:
+            CELERY_TASK_SECONDS.labels(task.name).observe(
+                time.perf_counter() - began)
+        CELERY_TASKS.labels(task.name, state or 'UNKNOWN').inc()
+
+    @signals.worker_ready.connect(weak=False)
+    def worker_ready(**kwargs):
+        if not port:
+            return
+        registry = REGISTRY
+        if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        start_http_server(port, registry=registry)
+        logger.info('Метрики воркера доступны на :%d/metrics', port)
+
+    @signals.worker_process_shutdown.connect(weak=False)
+    def worker_process_shutdown(pid=None, **kwargs):
+        if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+            multiprocess.mark_process_dead(pid or os.getpid())
@@ -0,0 +1,66 @@
+import re
+from datetime import datetime, timedelta
+
+DEADLINE_FORMAT = 'DD-MM-YYYY-HH-MM'
+FORMATS_HINT = (f'"текст {DEADLINE_FORMAT}", "текст +2h" '
+                f'или "текст завтра 10:00"')
+
+# Одна скомпилированная альтернатива на все формы срока, группы по номерам:
+# 1-5 — DD-MM-YYYY-HH-MM, 6-7 — +N и единица, 8-10 — день и HH:MM.
+DEADLINE_RE = re.compile(
+    r'(?<![\w+])(?:'
+    r'(\d{2})-(\d{2})-(\d{4})-(\d{2})-(\d{2})'
+    r'|\+(\d{1,4})\s?([mhdмчд])'
+    r'|(today|tomorrow|сегодня|завтра)\s+(\d{1,2}):(\d{2})'
+    r')(?!\w)',
+    re.IGNORECASE,
+)
+UNITS = {'m': 'minutes', 'м': 'minutes', 'h': 'hours', 'ч': 'hours',
+         'd': 'days', 'д': 'days'}
+TOMORROW = ('tomorrow', 'завтра')
+
+
+def find_deadline(text):
+    """Первый срок в тексте: re.Match со span() или None."""
+    return DEADLINE_RE.search(text)
+
+
+def deadline_from_match(match, now):
+    """Срок из совпадения DEADLINE_RE; относительные формы — от now.
+
+    Абсолютная дата собирается конструктором datetime из срезов, без
+    strptime; несуществующая дата даёт ValueError.
+    """
+    day, month, year, hour, minute, amount, unit, word, at_hour, \
+        at_minute = match.groups()
+    if day is not None:
+        return datetime(int(year), int(month), int(day), int(hour),
+                        int(minute))
+    now = now.replace(second=0, microsecond=0)
+    if amount is not None:
+        return now + timedelta(**{UNITS[unit.lower()]: int(amount)})
+    deadline = now.replace(hour=int(at_hour), minute=int(at_minute))
+    if word.lower() in TOMORROW:
+        deadline += timedelta(days=1)
+    return deadline
+
+
+def parse_task(line, now):
+    """Разбирает строку "описание срок" за один проход регулярки.
+
+    Возвращает (описание, срок); описание — текст вокруг срока. При
+    ошибке бросает ValueError с сообщением для пользователя.
+    """
+    match = find_deadline(line)
+    if match is None:
+        raise ValueError(f'🟧Даты не найдены. Проверьте формат: '
+                         f'{FORMATS_HINT}')
+    try:
+        deadline = deadline_from_match(match, now)
+    except (ValueError, OverflowError):
+        raise ValueError(f'🟧Некорректная дата {match.group(0)}') from None
+    start, end = match.span()
+    description = f'{line[:start].rstrip()} {line[end:].lstrip()}'.strip()
+    if not description:
+        raise ValueError('🟧Нет описания задачи.')
+    return description, deadline
@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta
+
+import pytz
+
+from config import MINUTES_AFTER_DEADLINE, TIMEZONE
+
+DAY_BEFORE = 'day_before'
+DEADLINE = 'deadline'
+OVERDUE = 'overdue'
+
+
+def utc_now():
+    """Текущее время в UTC без tzinfo — в этом виде хранится next_remind_at."""
+    return datetime.now(pytz.utc).replace(tzinfo=None)
+
+
+def local_now(tz_name=TIMEZONE):
+    """Текущее время в часовом поясе пользователей без tzinfo, как дедлайны."""
+    return datetime.now(pytz.timezone(tz_name)).replace(tzinfo=None)
+
+
+def deadline_to_utc(deadline, tz_name=TIMEZONE):
+    """Переводит дедлайн из часового пояса пользователя в наивный UTC."""
+    if deadline.tzinfo is None:
+        deadline = pytz.timezone(tz_name).localize(deadline)
+    return deadline.astimezone(pytz.utc).replace(tzinfo=None)
+
+
+def _slots(deadline):
+    day_before = deadline_to_utc(deadline - timedelta(days=1))
+    return day_before, deadline_to_utc(deadline)
+
+
+def next_remind_at(deadline, after):
+    """Первый слот напоминания строго позже after (UTC)."""
+    day_before, deadline_utc = _slots(deadline)
+    if after < day_before:
+        return day_before
+    if after < deadline_utc:
+        return deadline_utc
+    step = timedelta(minutes=MINUTES_AFTER_DEADLINE)
+    return deadline_utc + step * ((after - deadline_utc) // step + 1)
+
+
+def due_slot(deadline, now):
+    """Последний наступивший слот напоминания: (вид, время UTC) или None.
+
+    Если тик опоздал, берётся самый свежий слот, поэтому после простоя
+    пользователь получает одно актуальное напоминание, а не всю очередь.
+    """
+    day_before, deadline_utc = _slots(deadline)
+    if now < day_before:
+        return None
+    if now < deadline_utc:
+        return DAY_BEFORE, day_before
+    step = timedelta(minutes=MINUTES_AFTER_DEADLINE)
+    passed = (now - deadline_utc) // step
+    if passed == 0:
+        return DEADLINE, deadline_utc
+    return OVERDUE, deadline_utc + step * passed
+
+
+def reminder_text(kind, task_id, description):
+    if kind == DAY_BEFORE:
+        return f'№{task_id}🔔(за 1дн. до deadline ):\n' + description
+    if kind == DEADLINE:
+        return f'№{task_id}🔅 (в день дедлайна):\n' + description
+    return (f'№{task_id}⚠️ (просрочено, напоминаем с повтором '
+            f'{MINUTES_AFTER_DEADLINE} мин.):\n' + description)
@@ -0,0 +1,402 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from sqlalchemy import delete, exc, select, update
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from config import ARCHIVE_BATCH_SIZE, TASKS_PAGE_SIZE
+from core.metrics import observe_query
+from core.reminders import next_remind_at, utc_now
+from database.cache import MISS, OpenTaskRow, TaskRow, cache_key
+from database.db import (SCAN_BATCH_SIZE, TaskCacheMixin, TaskValidator,
+                         add_tasks_query, archive_candidates_query,
+                         archive_tasks_query, archived_tasks_query,
+                         complete_tasks_query, delete_tasks_query,
+                         due_tasks_query, logger, new_task_values,
+                         open_rows_query, open_tasks_query, page_from_rows,
+                         restored_task_values, tasks_page_query)
+from database.engine import create_async_db_engine
+from database.migrations import mark_schema_checked, migrate, schema_pending
+from database.models import ArchivedTask, Task
+
+
+class AsyncDatabase(TaskValidator, TaskCacheMixin):
+    """Асинхронный аналог Database на sqlalchemy.ext.asyncio.
+
+    Методы повторяют API Database, но являются корутинами и не блокируют
+    event loop бота. Перед использованием нужно вызвать init_db().
+    """
+
+    def __init__(self, database_url, cache=None):
+        self.database_url = database_url
+        self.cache = cache
+        self.engine = create_async_db_engine(database_url)
+        self.Session = async_sessionmaker(self.engine,
+                                          expire_on_commit=False)
+
+    async def init_db(self):
+        if not schema_pending(self.database_url):
+            return
+        try:
+            async with self.engine.connect() as connection:
+                await connection.run_sync(migrate)
+            mark_schema_checked(self.database_url)
+        except exc.SQLAlchemyError as e:
+            logger.error(f'🛑Ошибка при инициализации базы данных: {e}')
+        except Exception as e:
+            logger.error(f'🛑Неизвестная ошибка: {e}')
+
+    async def close(self):
+        await self.engine.dispose()
+        if self.cache is not None:
+            await self.cache.aclose()
+
+    @observe_query
+    async def add_task(self, description, deadline, user_id):
+        if not (self.validate_description(description) and
+                self.validate_deadline(deadline) and
+                self.validate_user_id(user_id)):
+            return None
+
+        async with self.Session() as session:
+            try:
+                task = Task(description=description,
+                            deadline=deadline,
+                            user_id=user_id,
+                            next_remind_at=next_remind_at(deadline,
+                                                          utc_now()))
+                session.add(task)
+                await session.commit()
+                await self._ainvalidate(user_id)
+                logger.info('🟩Задача %s успешно добавлена в базу данных.',
+                            task)
+                return task
+            except Exception as e:
+                logger.error(f"🛑Ошибка при добавлении задачи в базу "
+                             f"данных: {e}")
+                await session.rollback()
+                return None
+
+    @observe_query
+    async def complete_task(self, task_id):
+        if not self.validate_task_id(task_id):
+            return None
+
+        async with self.Session() as session:
+            try:
+                row = (await session.execute(
+                    update(Task).where(Task.id == task_id)
+                    .values(is_completed=True)
+                    .returning(Task.description, Task.user_id))).first()
+                await session.commit()
+                if row is None:
+                    return None
+                await self._ainvalidate(row.user_id)
+                logger.info('🟩Задача %s успешно завершена.', task_id)
+                return row.description
+            except Exception as e:
+                logger.error(f"🛑Ошибка при завершении задачи: {e}")
+                await session.rollback()
+                return None
+
+    @observe_query
+    async def delete_task(self, task_id):
+        if not self.validate_task_id(task_id):
+            return None
+
+        async with self.Session() as session:
+            try:
+                task = await session.get(Task, task_id)
+                if task:
+                    await session.execute(
+                        delete(Task).where(Task.id == task_id))
+                    await session.commit()
+                    await self._ainvalidate(task.user_id)
+                    logger.info('🟩Задача %s успешно удалена.', task_id)
+                    return task
+                logger.warning(
+                    f"🟧Попытка удалить задачу {task_id}, но"
+                    f" она не найдена в БД.")
+                return None
+            except Exception as e:
+                logger.error(f"🛑Ошибка при удалении задачи: {e}")
+                await session.rollback()
+                return None
+
+    @observe_query
+    async def add_tasks(self, rows):
+        if not self.validate_new_tasks(rows):
+            return None
+
+        async with self.Session() as session:
+            try:
+                created = (await session.execute(
+                    add_tasks_query(), new_task_values(rows, utc_now())
+                )).all()
+                await session.commit()
+                for user_id in {row.user_id for row in created}:
+                    await self._ainvalidate(user_id)
+                logger.info('🟩Добавлено задач: %d.', len(created))
+                return [TaskRow(row.id, row.description, row.deadline)
+                        for row in sorted(created, key=lambda row: row.id)]
+            except Exception as e:
+                logger.error(f"🛑Ошибка при пакетном добавлении задач: {e}")
+                await session.rollback()
+                return None
+
+    @observe_query
+    async def complete_tasks(self, task_ids, user_id):
+        if not (self.validate_task_ids(task_ids) and
+                self.validate_user_id(user_id)):
+            return None
+
+        async with self.Session() as session:
+            try:
+                completed = (await session.execute(
+                    complete_tasks_query(task_ids, user_id))).all()
+                await session.commit()
+                if completed:
+                    await self._ainvalidate(user_id)
+                logger.info('🟩Завершено задач пользователя %s: %d.',
+                            user_id, len(completed))
+                return completed
+            except Exception as e:
+                logger.error(f"🛑Ошибка при завершении задач: {e}")
+                await session.rollback()
+                return None
+
+    @observe_query
+    async def delete_tasks(self, task_ids, user_id):
+        if not (self.validate_task_ids(task_ids) and
+                self.validate_user_id(user_id)):
+            return None
+
+        async with self.Session() as session:
+            try:
+                deleted = (await session.execute(
+                    delete_tasks_query(task_ids, user_id))).all()
+                await session.commit()
+                if deleted:
+                    await self._ainvalidate(user_id)
+                logger.info('🟩Удалено задач пользователя %s: %d.',
+                            user_id, len(deleted))
+                return deleted
+            except Exception as e:
+                logger.error(f"🛑Ошибка при удалении задач: {e}")
+                await session.rollback()
+                return None
+
+    @observe_query
+    async def get_tasks(self, user_id):
+        if not self.validate_user_id(user_id):
+            return None
+
+        tasks, generation = await self._acached(user_id, cache_key())
+        if tasks is not MISS:
+            return tasks
+
+        async with self.Session() as session:
+            try:
+                tasks = [TaskRow(*row) for row in
+                         await session.execute(open_tasks_query(user_id))]
+                await self._aremember(user_id, cache_key(), tasks,
+                                      generation)
+                if tasks:
+                    logger.info('Получено задач для пользователя %s: %d.',
+                                user_id, len(tasks))
+                else:
+                    logger.warning(
+                        '🟧Задачи для пользователя %s не найдены.', user_id)
+                return tasks
+            except Exception as e:
+                logger.error(
+                    f"🛑Ошибка при получении задач для пользователя"
+                    f"{user_id}: {e}")
+                return None
+
+    @observe_query
+    async def get_tasks_page(self, user_id, after=None, before=None,
+                             limit=TASKS_PAGE_SIZE):
+        if not self.validate_user_id(user_id):
+            return None
+
+        key = cache_key(after, before, limit)
+        page, generation = await self._acached(user_id, key)
+        if page is not MISS:
+            return page
+
+        async with self.Session() as session:
+            try:
+                tasks = (await session.execute(
+                    tasks_page_query(user_id, after, before, limit))).all()
+                page = page_from_rows(tasks, before, limit)
+                await self._aremember(user_id, key, page, generation)
+                return page
+            except Exception as e:
+                logger.error(
+                    f"🛑Ошибка при получении страницы задач для "
+                    f"пользователя {user_id}: {e}")
+                return None
+
+    @observe_query
+    async def get_all_not_completed_tasks(self):
+        async with self.Session() as session:
+            try:
+                tasks = [OpenTaskRow(*row) for row in
+                         await session.execute(open_rows_query())]
+                logger.info('Получено незавершенных задач: %d.', len(tasks))
+                return tasks
+            except Exception as e:
+                logger.error(f"🛑Ошибка при получении всех задач: {e}")
+                return None
+
+    @observe_query
+    async def get_all_user_ids(self):
+        async with self.Session() as session:
+            try:
+                user_ids = (await session.scalars(
+                    select(Task.user_id).distinct())).all()
+                logger.info('Получено уникальных user_id: %d.', len(user_ids))
+                return list(user_ids)
+            except Exception as e:
+                logger.error(f"🛑Ошибка при получении всех user_id: {e}")
+                return None
+
+    @observe_query
+    async def get_due_tasks(self, now, shard=0, shards=1):
+        async with self.Session() as session:
+            try:
+                tasks = [OpenTaskRow(*row) for row in await session.execute(
+                    due_tasks_query(now, shard, shards))]
+                logger.info('Получено задач к напоминанию (шард %d/%d): %d.',
+                            shard, shards, len(tasks))
+                return tasks
+            except Exception as e:
+                logger.error(f"🛑Ошибка при получении задач к "
+                             f"напоминанию: {e}")
+                return None
+
+    async def iter_open_tasks(self, chunk_size=SCAN_BATCH_SIZE, due_at=None,
+                              shard=0, shards=1):
+        if due_at is None:
+            query = open_rows_query()
+            if shards > 1:
+                query = query.filter(Task.user_id % shards == shard)
+        else:
+            query = due_tasks_query(due_at, shard, shards)
+        query = query.execution_options(yield_per=chunk_size)
+        async with self.Session() as session:
+            try:
+                result = await session.stream(query)
+                async for chunk in result.partitions():
+                    yield [OpenTaskRow(*row) for row in chunk]
+            except Exception as e:
+                logger.error(f"🛑Ошибка при потоковом чтении задач: {e}")
+
+    @observe_query
+    async def set_next_remind_at(self, schedule):
+        if not schedule:
+            return True
+        async with self.Session() as session:
+            try:
+                await session.execute(update(Task), [
+                    {'id': task_id, 'next_remind_at': remind_at}
+                    for task_id, remind_at in schedule.items()
+                ])
+                await session.commit()
+                return True
+            except Exception as e:
+                logger.error(f"🛑Ошибка при обновлении расписания "
+                             f"напоминаний: {e}")
+                await session.rollback()
+                return False
+
+    @observe_query
+    async def archive_tasks(self, batch_size=ARCHIVE_BATCH_SIZE,
+                            overdue_before=None):
+        async with self.Session() as session:
+            try:
+                task_ids = (await session.scalars(archive_candidates_query(
+                    batch_size, overdue_before))).all()
+                if not task_ids:
+                    return 0
+                await session.execute(
+                    archive_tasks_query(task_ids, utc_now()))
+                user_ids = (await session.scalars(
+                    delete(Task).where(Task.id.in_(task_ids))
+                    .returning(Task.user_id)
+                    .execution_options(synchronize_session=False))).all()
+                await session.commit()
+                for user_id in set(user_ids):
+                    await self._ainvalidate(user_id)
+                logger.info('🟩Перенесено в архив задач: %d.',
+                            len(task_ids))
+                return len(task_ids)
+            except Exception as e:
+                logger.error(f"🛑Ошибка при архивации задач: {e}")
+                await session.rollback()
+                return None
+
+    @observe_query
+    async def restore_tasks(self, user_id, task_ids=None):
+        if not self.validate_user_id(user_id):
+            return None
+        if task_ids is not None and not self.validate_task_ids(task_ids):
+            return None
+
+        async with self.Session() as session:
+            try:
+                archived = (await session.scalars(
+                    archived_tasks_query(user_id, task_ids))).all()
+                if not archived:
+                    return []
+                created = (await session.execute(
+                    add_tasks_query(),
+                    restored_task_values(archived, utc_now()))).all()
+                await session.execute(delete(ArchivedTask).where(
+                    ArchivedTask.id.in_([task.id for task in archived])))
+                await session.commit()
+                await self._ainvalidate(user_id)
+                logger.info('🟩Восстановлено из архива задач пользователя '
+                            '%s: %d.', user_id, len(created))
+                return [TaskRow(row.id, row.description, row.deadline)
+                        for row in sorted(created, key=lambda row: row.id)]
+            except Exception as e:
+                logger.error(f"🛑Ошибка при восстановлении задач: {e}")
+                await session.rollback()
+                return None
+
+
+class ThreadedDatabase:
+    """Запасной вариант: синхронный Database в ограниченном пуле потоков.
+
+    Публичные методы Database становятся корутинами с тем же API, так что
+    TaskBot работает с ним так же, как с AsyncDatabase.
+    """
+
+    def __init__(self, database, max_workers=4):
+        self.database = database
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='db')
+
+    async def init_db(self):
+        await self._run(self.database.init_db)
+
+    async def close(self):
+        self.executor.shutdown(wait=True)
+        self.database.engine.dispose()
+
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor,
+                                          partial(func, *args, **kwargs))
+
+    def __getattr__(self, name):
+        method = getattr(self.database, name)
+        if not callable(method):
+            return method
+
+        async def wrapper(*args, **kwargs):
+            return await self._run(method, *args, **kwargs)
+        return wrapper
@@ -0,0 +1,229 @@
+import json
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+
+from config import LOG_PATCH
+from core.logger import OvayLogger
+from core.metrics import CACHE_EVENTS, CACHE_USERS
+
+logger = OvayLogger(
+    name='cache_logger', log_file_path=LOG_PATCH
+).get_logger()
+
+# Строка списка задач: столбцы, которые читает /list.
+TaskRow = namedtuple('TaskRow', 'id description deadline')
+# Открытая задача для планировщика напоминаний и массовых выборок.
+OpenTaskRow = namedtuple('OpenTaskRow',
+                         'id description deadline user_id next_remind_at')
+
+# Отличает промах от закэшированного пустого списка.
+MISS = object()
+
+
+def cache_key(after=None, before=None, limit=None):
+    """Ключ внутри кэша пользователя: весь список или одна страница."""
+    if after is None and before is None and limit is None:
+        return 'all'
+    cursor = after if after is not None else before
+    cursor = (f'{cursor[0].isoformat()}/{cursor[1]}'
+              if cursor is not None else '')
+    direction = 'before' if before is not None else 'after'
+    return f'page:{direction}:{cursor}:{limit}'
+
+
+def _encode(value):
+    if isinstance(value, tuple):
+        rows, has_more = value
+    else:
+        rows, has_more = value, None
+    return json.dumps({
+        'rows': [[row.id, row.description, row.deadline.isoformat()]
+                 for row in rows],
+        'has_more': has_more,
+    }, ensure_ascii=False)
+
+
+def _decode(raw):
+    data = json.loads(raw)
+    rows = [TaskRow(task_id, description, datetime.fromisoformat(deadline))
+            for task_id, description, deadline in data['rows']]
+    if data['has_more'] is None:
+        return rows
+    return rows, data['has_more']
+
+
+class TaskCache:
+    """Read-through кэш открытых задач пользователя.
+
+    Первый уровень — LRU в памяти процесса с TTL, второй (необязательный) —
+    Redis, общий для нескольких процессов бота. Любая запись задач
+    пользователя сбрасывает его записи целиком. Счётчик поколений не даёт
+    чтению, начатому до записи, положить в кэш устаревший результат.
+    Ошибки Redis и повреждённые записи не фатальны: кэш просто работает
+    как промах. Database вызывает get/set/invalidate с redis.Redis,
+    AsyncDatabase — aget/aset/ainvalidate с redis.asyncio.Redis, чтобы
+    запросы к Redis не блокировали event loop бота. Счётчики
+    stats() дублируются в метрики task_cache_events_total{event} и
+    task_cache_users.
+    """
+
+    def __init__(self, max_users=10000, ttl=300, redis_client=None):
+        self.max_users = max_users
+        self.ttl = ttl
+        self.redis = redis_client
+        self.entries = OrderedDict()
+        self.generations = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _redis_key(self, user_id):
+        return f'tasks:cache:{user_id}'
+
+    def generation(self, user_id):
+        with self.lock:
+            return self.generations.get(user_id, 0)
+
+    def _get_local(self, user_id, key, now):
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry and entry[0] > now and key in entry[1]:
+                self.entries.move_to_end(user_id)
+                return entry[1][key]
+        return MISS
+
+    def _from_redis(self, user_id, key, raw, now):
+        """Значение из Redis или MISS, если записи нет или она повреждена."""
+        if raw is None:
+            return MISS
+        try:
+            value = _decode(raw)
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning(f'🟧Повреждённая запись Redis-кэша пользователя '
+                           f'{user_id}: {e}')
+            return MISS
+        self._store(user_id, key, value, now)
+        return value
+
+    def _count(self, value):
+        event = 'miss' if value is MISS else 'hit'
+        with self.lock:
+            if value is MISS:
+                self.misses += 1
+            else:
+                self.hits += 1
+        CACHE_EVENTS.labels(event).inc()
+        return value
+
+    def get(self, user_id, key):
+        now = time.monotonic()
+        value = self._get_local(user_id, key, now)
+        if value is MISS and self.redis is not None:
+            try:
+                raw = self.redis.hget(self._redis_key(user_id), key)
+            except Exception as e:
+                logger.warning(f'🟧Redis-кэш недоступен: {e}')
+                raw = None
+            value = self._from_redis(user_id, key, raw, now)
+        return self._count(value)
+
+    async def aget(self, user_id, key):
+        """get() для redis.asyncio: не блокирует event loop."""
+        now = time.monotonic()
+        value = self._get_local(user_id, key, now)
+        if value is MISS and self.redis is not None:
+            try:
+                raw = await self.redis.hget(self._redis_key(user_id), key)
+            except Exception as e:
+                logger.warning(f'🟧Redis-кэш недоступен: {e}')
+                raw = None
+            value = self._from_redis(user_id, key, raw, now)
+        return self._count(value)
+
+    def _store(self, user_id, key, value, now):
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is None or entry[0] <= now:
+                entry = self.entries[user_id] = (now + self.ttl, {})
+            entry[1][key] = value
+            self.entries.move_to_end(user_id)
+            while len(self.entries) > self.max_users:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+                CACHE_EVENTS.labels('eviction').inc()
+            CACHE_USERS.set(len(self.entries))
+
+    def _set_local(self, user_id, key, value, generation):
+        if self.generation(user_id) != generation:
+            return False
+        self._store(user_id, key, value, time.monotonic())
+        return True
+
+    def _redis_pipeline(self, user_id, key, value):
+        pipe = self.redis.pipeline()
+        pipe.hset(self._redis_key(user_id), key, _encode(value))
+        pipe.expire(self._redis_key(user_id), self.ttl)
+        return pipe
+
+    def set(self, user_id, key, value, generation):
+        """Кладёт результат, если с момента generation() записей не было."""
+        if not self._set_local(user_id, key, value, generation) or \
+                self.redis is None:
+            return
+        try:
+            self._redis_pipeline(user_id, key, value).execute()
+        except Exception as e:
+            logger.warning(f'🟧Redis-кэш недоступен: {e}')
+
+    async def aset(self, user_id, key, value, generation):
+        if not self._set_local(user_id, key, value, generation) or \
+                self.redis is None:
+            return
+        try:
+            await self._redis_pipeline(user_id, key, value).execute()
+        except Exception as e:
+            logger.warning(f'🟧Redis-кэш недоступен: {e}')
+
+    def _invalidate_local(self, user_id):
+        with self.lock:
+            self.generations[user_id] = self.generations.get(user_id, 0) + 1
+            self.entries.pop(user_id, None)
+            self.invalidations += 1
+            CACHE_EVENTS.labels('invalidation').inc()
+            CACHE_USERS.set(len(self.entries))
+
+    def invalidate(self, user_id):
+        self._invalidate_local(user_id)
+        if self.redis is not None:
+            try:
+                self.redis.delete(self._redis_key(user_id))
+            except Exception as e:
+                logger.warning(f'🟧Redis-кэш недоступен: {e}')
+
+    async def ainvalidate(self, user_id):
+        # Поколение растёт до первого await: чтение, начатое до записи,
+        # уже не положит в кэш устаревший результат.
+        self._invalidate_local(user_id)
+        if self.redis is not None:
+            try:
+                await self.redis.delete(self._redis_key(user_id))
+            except Exception as e:
+                logger.warning(f'🟧Redis-кэш недоступен: {e}')
+
+    async def aclose(self):
+        if self.redis is not None:
+            await self.redis.aclose()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'users': len(self.entries),
+            }
@@ -1,55 +1,187 @@
 from datetime import datetime
 
-from sqlalchemy import create_engine, exc, inspect
+from sqlalchemy import (DateTime, delete, exc, insert, literal, or_, select,
+                        true, tuple_, update)
 from sqlalchemy.orm import sessionmaker
 
-from config import LOG_PATCH
+from config import ARCHIVE_BATCH_SIZE, LOG_PATCH, TASKS_PAGE_SIZE
 from core.logger import OvayLogger
-from database.models import Base, Task
+from core.metrics import observe_query
+from core.reminders import next_remind_at, utc_now
+from database.cache import MISS, OpenTaskRow, TaskRow, cache_key
+from database.engine import get_engine
+from database.migrations import mark_schema_checked, migrate, schema_pending
+from database.models import ArchivedTask, Task
 
 logger = OvayLogger(
     name="bd_logger", log_file_path=LOG_PATCH
 ).get_logger()
 
+# Сколько строк за раз забирать из курсора в массовых выборках.
+SCAN_BATCH_SIZE = 1000
 
-class Database:
-    def __init__(self, database_url):
-        self.database_url = database_url
-        self.engine = create_engine(database_url)
-        self.Session = sessionmaker(bind=self.engine)
-        self.init_db()
 
-    def init_db(self):
-        try:
-            logger.debug('Подключение к базе данных...')
-            inspector = inspect(self.engine)
-            logger.debug('Получаем список существующих таблиц...')
-            existing_tables = inspector.get_table_names()
-            logger.debug(f'Существующие таблицы: {existing_tables}')
-            if not existing_tables:
-                logger.info('🟧Таблицы в БД не найдены. Начинаем '
-                            'создание таблиц...')
-                try:
-                    Base.metadata.create_all(self.engine)
-                    logger.info('🟩Таблицы успешно созданы в базе данных.')
-                except exc.SQLAlchemyError as e:
-                    logger.error(f'🛑Ошибка при создании таблиц: {e}')
-            else:
-                logger.debug('🟩Таблицы уже существуют, создание не требуется.')
-        except exc.SQLAlchemyError as e:
-            logger.error(f'🛑Ошибка при подключении к базе данных: {e}')
-        except Exception as e:
-            logger.error(f'🛑Неизвестная ошибка: {e}')
+def open_tasks_query(user_id):
+    """Открытые задачи пользователя: только нужные столбцы, по дедлайну."""
+    return select(Task.id, Task.description, Task.deadline).filter_by(
+        user_id=user_id, is_completed=False
+    ).order_by(Task.deadline, Task.id)
 
-    def _get_session(self):
-        session = self.Session()
-        logger.debug('🟦Открываем сессию к базе данных...')
-        return session
 
-    def close_session(self, session):
-        session.close()
-        logger.debug('🟦Закрываем соединение с базой данных.')
+def tasks_page_query(user_id, after=None, before=None,
+                     limit=TASKS_PAGE_SIZE):
+    """Keyset-пагинация по (deadline, id) вместо OFFSET.
+
+    after/before — ключ (deadline, id) последней или первой задачи
+    соседней страницы. Берётся limit + 1 строк, чтобы узнать, есть ли
+    ещё страница в этом направлении.
+    """
+    query = select(Task.id, Task.description, Task.deadline).filter_by(
+        user_id=user_id, is_completed=False)
+    key = tuple_(Task.deadline, Task.id)
+    if before is not None:
+        return query.filter(key < tuple(before)).order_by(
+            Task.deadline.desc(), Task.id.desc()).limit(limit + 1)
+    if after is not None:
+        query = query.filter(key > tuple(after))
+    return query.order_by(Task.deadline, Task.id).limit(limit + 1)
+
+
+def open_rows_query():
+    """Столбцы OpenTaskRow незавершённых задач, без ORM-экземпляров."""
+    return select(Task.id, Task.description, Task.deadline, Task.user_id,
+                  Task.next_remind_at).filter_by(is_completed=False)
+
+
+def due_tasks_query(now, shard=0, shards=1):
+    """Незавершённые задачи с наступившим напоминанием.
+
+    Чистый диапазон по индексу (is_completed, next_remind_at): задачам
+    без next_remind_at его рассчитывает миграция 5. При shards > 1
+    берётся только шард user_id % shards == shard: все задачи
+    пользователя обрабатывает один и тот же шард.
+    """
+    query = open_rows_query().filter(Task.next_remind_at <= now)
+    if shards > 1:
+        query = query.filter(Task.user_id % shards == shard)
+    return query.order_by(Task.next_remind_at)
+
+
+def page_from_rows(rows, before, limit):
+    has_more = len(rows) > limit
+    rows = [TaskRow(*row) for row in rows[:limit]]
+    if before is not None:
+        rows.reverse()
+    return rows, has_more
+
+
+def new_task_values(rows, now):
+    """Параметры пакетного INSERT из [(description, deadline, user_id)]."""
+    return [{'description': description, 'deadline': deadline,
+             'user_id': user_id, 'is_completed': False,
+             'next_remind_at': next_remind_at(deadline, now)}
+            for description, deadline, user_id in rows]
+
+
+def add_tasks_query():
+    # Без sort_by_parameter_order: SQLite тогда вставляет по строке.
+    # Порядок rows восстанавливается сортировкой по автоинкрементному id.
+    return insert(Task).returning(Task.id, Task.description, Task.deadline,
+                                  Task.user_id)
+
+
+def complete_tasks_query(task_ids, user_id):
+    return update(Task).where(
+        Task.id.in_(task_ids), Task.user_id == user_id
+    ).values(is_completed=True).returning(
+        Task.id, Task.description
+    ).execution_options(synchronize_session=False)
+
+
+def delete_tasks_query(task_ids, user_id):
+    return delete(Task).where(
+        Task.id.in_(task_ids), Task.user_id == user_id
+    ).returning(
+        Task.id, Task.description
+    ).execution_options(synchronize_session=False)
+
+
+ARCHIVE_COLUMNS = ('id', 'description', 'deadline', 'user_id',
+                   'is_completed', 'next_remind_at')
+
+
+def archive_candidates_query(batch_size, overdue_before=None):
+    """id следующей пачки для архива: завершённые и, если задано,
+    открытые задачи с дедлайном раньше overdue_before."""
+    condition = Task.is_completed == true()
+    if overdue_before is not None:
+        condition = or_(condition, Task.deadline < overdue_before)
+    return select(Task.id).where(condition).order_by(Task.id).limit(
+        batch_size)
+
+
+def archive_tasks_query(task_ids, archived_at):
+    """INSERT … SELECT задач task_ids из tasks в tasks_archive."""
+    columns = [getattr(Task, name) for name in ARCHIVE_COLUMNS]
+    return insert(ArchivedTask).from_select(
+        ('task_id',) + ARCHIVE_COLUMNS[1:] + ('archived_at',),
+        select(*columns, literal(archived_at, DateTime)).where(
+            Task.id.in_(task_ids)))
+
+
+def archived_tasks_query(user_id, task_ids=None):
+    query = select(ArchivedTask).filter_by(user_id=user_id)
+    if task_ids is not None:
+        query = query.where(ArchivedTask.task_id.in_(task_ids))
+    return query
+
+
+def restored_task_values(archived, now):
+    """Параметры INSERT для задач из архива; открытым — новое напоминание."""
+    return [{'description': task.description, 'deadline': task.deadline,
+             'user_id': task.user_id, 'is_completed': task.is_completed,
+             'next_remind_at': (None if task.is_completed else
+                                next_remind_at(task.deadline, now))}
+            for task in archived]
+
+
+class TaskCacheMixin:
+    """Обращения к необязательному TaskCache из self.cache.
+
+    Методы с префиксом _a — для AsyncDatabase, остальные — для Database.
+    """
+
+    def _cached(self, user_id, key):
+        """Возвращает (значение или MISS, поколение для _remember)."""
+        if self.cache is None:
+            return MISS, None
+        generation = self.cache.generation(user_id)
+        return self.cache.get(user_id, key), generation
 
+    def _remember(self, user_id, key, value, generation):
+        if self.cache is not None and value is not None:
+            self.cache.set(user_id, key, value, generation)
+
+    def _invalidate(self, user_id):
+        if self.cache is not None:
+            self.cache.invalidate(user_id)
+
+    async def _acached(self, user_id, key):
+        if self.cache is None:
+            return MISS, None
+        generation = self.cache.generation(user_id)
+        return await self.cache.aget(user_id, key), generation
+
+    async def _aremember(self, user_id, key, value, generation):
+        if self.cache is not None and value is not None:
+            await self.cache.aset(user_id, key, value, generation)
+
+    async def _ainvalidate(self, user_id):
+        if self.cache is not None:
+            await self.cache.ainvalidate(user_id)
+
+
+class TaskValidator:
     def validate_description(self, description: str) -> bool:
         """Валидация описания задачи."""
         if not isinstance(description, str) or not description:
@@ -80,6 +212,19 @@ class Database:
             return False
         return True
 
+    def validate_new_tasks(self, rows) -> bool:
+        """Валидация строк пакетного добавления."""
+        return bool(rows) and all(
+            self.validate_description(description) and
+            self.validate_deadline(deadline) and
+            self.validate_user_id(user_id)
+            for description, deadline, user_id in rows)
+
+    def validate_task_ids(self, task_ids) -> bool:
+        """Валидация списка task_id."""
+        return bool(task_ids) and all(
+            self.validate_task_id(task_id) for task_id in task_ids)
+
     def validate_task_id(self, task_id: int) -> bool:
         """Валидация task_id."""
         if not isinstance(task_id, int) or task_id < 1:
@@ -90,6 +235,52 @@ class Database:
             return False
         return True
 
+
+class Database(TaskValidator, TaskCacheMixin):
+    """Синхронный доступ к задачам.
+
+    Конструктор к базе не подключается: engine общий на процесс и
+    создаётся при первом запросе, тогда же один раз проверяется схема.
+    """
+
+    def __init__(self, database_url, cache=None):
+        self.database_url = database_url
+        self.cache = cache
+        self._session_factory = None
+
+    @property
+    def engine(self):
+        return get_engine(self.database_url)
+
+    @property
+    def Session(self):
+        if self._session_factory is None:
+            self._session_factory = sessionmaker(bind=self.engine)
+        return self._session_factory
+
+    def init_db(self):
+        if not schema_pending(self.database_url):
+            return
+        try:
+            with self.engine.connect() as connection:
+                migrate(connection)
+            mark_schema_checked(self.database_url)
+        except exc.SQLAlchemyError as e:
+            logger.error(f'🛑Ошибка при инициализации базы данных: {e}')
+        except Exception as e:
+            logger.error(f'🛑Неизвестная ошибка: {e}')
+
+    def _get_session(self):
+        self.init_db()
+        session = self.Session()
+        logger.debug('🟦Открываем сессию к базе данных...')
+        return session
+
+    def close_session(self, session):
+        session.close()
+        logger.debug('🟦Закрываем соединение с базой данных.')
+
+    @observe_query
     def add_task(self, description, deadline, user_id):
         if not (self.validate_description(description) and
                 self.validate_deadline(deadline) and
@@ -100,11 +291,15 @@ class Database:
             try:
                 task = Task(description=description,
                             deadline=deadline,
-                            user_id=user_id)
+                            user_id=user_id,
+                            next_remind_at=next_remind_at(deadline,
+                                                          utc_now()))
                 session.add(task)
                 session.commit()
                 session.refresh(task)
-                logger.info(f'🟩Задача {task} успешно добавлена в базу данных.')
+                self._invalidate(user_id)
+                logger.info('🟩Задача %s успешно добавлена в базу данных.',
+                            task)
                 return task
             except Exception as e:
                 logger.error(f"🛑Ошибка при добавлении задачи в базу "
@@ -114,6 +309,7 @@ class Database:
             finally:
                 self.close_session(session)
 
+    @observe_query
     def complete_task(self, task_id):
         if not self.validate_task_id(task_id):
             return None
@@ -124,7 +320,8 @@ class Database:
                 if task:
                     task.is_completed = True
                     session.commit()
-                    logger.info(f'🟩Задача {task_id} успешно завершена.')
+                    self._invalidate(task.user_id)
+                    logger.info('🟩Задача %s успешно завершена.', task_id)
                     return task.description
                 return None
             except Exception as e:
@@ -134,6 +331,7 @@ class Database:
             finally:
                 self.close_session(session)
 
+    @observe_query
     def delete_task(self, task_id):
         if not self.validate_task_id(task_id):
             return None
@@ -144,7 +342,8 @@ class Database:
                 if task:
                     session.delete(task)
                     session.commit()
-                    logger.info(f"🟩Задача {task_id} успешно удалена.")
+                    self._invalidate(task.user_id)
+                    logger.info('🟩Задача %s успешно удалена.', task_id)
                     return task
                 else:
                     logger.warning(
@@ -158,26 +357,102 @@ class Database:
             finally:
                 self.close_session(session)
 
+    @observe_query
+    def add_tasks(self, rows):
+        """Добавляет задачи одним INSERT … RETURNING в одной транзакции.
+
+        rows — [(description, deadline, user_id)]; возвращает TaskRow
+        в порядке rows.
+        """
+        if not self.validate_new_tasks(rows):
+            return None
+
+        with self._get_session() as session:
+            try:
+                created = session.execute(
+                    add_tasks_query(), new_task_values(rows, utc_now())
+                ).all()
+                session.commit()
+                for user_id in {row.user_id for row in created}:
+                    self._invalidate(user_id)
+                logger.info('🟩Добавлено задач: %d.', len(created))
+                return [TaskRow(row.id, row.description, row.deadline)
+                        for row in sorted(created, key=lambda row: row.id)]
+            except Exception as e:
+                logger.error(f"🛑Ошибка при пакетном добавлении задач: {e}")
+                session.rollback()
+                return None
+            finally:
+                self.close_session(session)
+
+    @observe_query
+    def complete_tasks(self, task_ids, user_id):
+        """Завершает задачи пользователя; возвращает [(id, description)]."""
+        if not (self.validate_task_ids(task_ids) and
+                self.validate_user_id(user_id)):
+            return None
+
+        with self._get_session() as session:
+            try:
+                completed = session.execute(
+                    complete_tasks_query(task_ids, user_id)).all()
+                session.commit()
+                if completed:
+                    self._invalidate(user_id)
+                logger.info('🟩Завершено задач пользователя %s: %d.',
+                            user_id, len(completed))
+                return completed
+            except Exception as e:
+                logger.error(f"🛑Ошибка при завершении задач: {e}")
+                session.rollback()
+                return None
+            finally:
+                self.close_session(session)
+
+    @observe_query
+    def delete_tasks(self, task_ids, user_id):
+        """Удаляет задачи пользователя; возвращает [(id, description)]."""
+        if not (self.validate_task_ids(task_ids) and
+                self.validate_user_id(user_id)):
+            return None
+
+        with self._get_session() as session:
+            try:
+                deleted = session.execute(
+                    delete_tasks_query(task_ids, user_id)).all()
+                session.commit()
+                if deleted:
+                    self._invalidate(user_id)
+                logger.info('🟩Удалено задач пользователя %s: %d.',
+                            user_id, len(deleted))
+                return deleted
+            except Exception as e:
+                logger.error(f"🛑Ошибка при удалении задач: {e}")
+                session.rollback()
+                return None
+            finally:
+                self.close_session(session)
+
+    @observe_query
     def get_tasks(self, user_id):
         if not self.validate_user_id(user_id):
             return None
 
+        tasks, generation = self._cached(user_id, cache_key())
+        if tasks is not MISS:
+            return tasks
+
         with self._get_session() as session:
             try:
-                user_exists = session.query(Task).filter_by(
-                    user_id=user_id).first()
-                if not user_exists:
-                    logger.warning(
-                        f"🟧Пользователь с user_id {user_id} не найден.")
-                    return None
-                tasks = session.query(Task).filter_by(user_id=user_id,
-                                                      is_completed=False).all()
+                tasks = [TaskRow(*row) for row in
+                         session.execute(open_tasks_query(user_id))]
+                self._remember(user_id, cache_key(), tasks, generation)
                 if tasks:
-                    logger.info(
-                        f'Получены задачи для пользователя {user_id}: {tasks}.')
+                    logger.info('Получено задач для пользователя %s: %d.',
+                                user_id, len(tasks))
                 else:
                     logger.warning(
-                        f"🟧Задачи для пользователя {user_id} не найдены.")
+                        '🟧Задачи для пользователя %s не найдены.', user_id)
                 return tasks
             except Exception as e:
                 logger.error(
@@ -187,11 +462,41 @@ class Database:
             finally:
                 self.close_session(session)
 
+    @observe_query
+    def get_tasks_page(self, user_id, after=None, before=None,
+                       limit=TASKS_PAGE_SIZE):
+        """Страница открытых задач пользователя: (задачи, есть_ли_ещё)."""
+        if not self.validate_user_id(user_id):
+            return None
+
+        key = cache_key(after, before, limit)
+        page, generation = self._cached(user_id, key)
+        if page is not MISS:
+            return page
+
+        with self._get_session() as session:
+            try:
+                tasks = session.execute(
+                    tasks_page_query(user_id, after, before, limit)).all()
+                page = page_from_rows(tasks, before, limit)
+                self._remember(user_id, key, page, generation)
+                return page
+            except Exception as e:
+                logger.error(
+                    f"🛑Ошибка при получении страницы задач для "
+                    f"пользователя {user_id}: {e}")
+                return None
+            finally:
+                self.close_session(session)
+
+    @observe_query
     def get_all_not_completed_tasks(self):
         with self._get_session() as session:
             try:
-                tasks = session.query(Task).filter_by(is_completed=False).all()
-                logger.info(f'Получены все незавершенные задачи: {tasks}.')
+                tasks = [OpenTaskRow(*row) for row in session.execute(
+                    open_rows_query().execution_options(
+                        yield_per=SCAN_BATCH_SIZE))]
+                logger.info('Получено незавершенных задач: %d.', len(tasks))
                 return tasks
             except Exception as e:
                 logger.error(f"🛑Ошибка при получении всех задач: {e}")
@@ -199,13 +504,158 @@ class Database:
             finally:
                 self.close_session(session)
 
+    @observe_query
     def get_all_user_ids(self):
         with self._get_session() as session:
             try:
                 user_ids = session.query(Task.user_id).distinct().all()
-                logger.info(f'Получены все уникальные user_id: {user_ids}.')
+                logger.info('Получено уникальных user_id: %d.', len(user_ids))
                 return [user_id[0] for user_id in
                         user_ids]  # Извлекаем id из кортежей
             except Exception as e:
                 logger.error(f"🛑Ошибка при получении всех user_id: {e}")
                 return None
+            finally:
+                self.close_session(session)
+
+    @observe_query
+    def get_due_tasks(self, now, shard=0, shards=1):
+        """Задачи, чьё напоминание наступило к моменту now (UTC).
+
+        shard/shards ограничивают выборку одним шардом по user_id.
+        """
+        with self._get_session() as session:
+            try:
+                tasks = [OpenTaskRow(*row) for row in session.execute(
+                    due_tasks_query(now, shard, shards).execution_options(
+                        yield_per=SCAN_BATCH_SIZE))]
+                logger.info('Получено задач к напоминанию (шард %d/%d): %d.',
+                            shard, shards, len(tasks))
+                return tasks
+            except Exception as e:
+                logger.error(f"🛑Ошибка при получении задач к "
+                             f"напоминанию: {e}")
+                return None
+            finally:
+                self.close_session(session)
+
+    @observe_query
+    def archive_tasks(self, batch_size=ARCHIVE_BATCH_SIZE,
+                      overdue_before=None):
+        """Переносит одну пачку задач из tasks в tasks_archive.
+
+        Берутся завершённые задачи и, если задан overdue_before, открытые
+        с дедлайном раньше него. Копирование и удаление идут в одной
+        транзакции. Возвращает число перенесённых задач или None.
+        """
+        with self._get_session() as session:
+            try:
+                task_ids = session.scalars(archive_candidates_query(
+                    batch_size, overdue_before)).all()
+                if not task_ids:
+                    return 0
+                session.execute(archive_tasks_query(task_ids, utc_now()))
+                user_ids = session.scalars(
+                    delete(Task).where(Task.id.in_(task_ids))
+                    .returning(Task.user_id)
+                    .execution_options(synchronize_session=False)).all()
+                session.commit()
+                for user_id in set(user_ids):
+                    self._invalidate(user_id)
+                logger.info('🟩Перенесено в архив задач: %d.',
+                            len(task_ids))
+                return len(task_ids)
+            except Exception as e:
+                logger.error(f"🛑Ошибка при архивации задач: {e}")
+                session.rollback()
+                return None
+            finally:
+                self.close_session(session)
+
+    @observe_query
+    def restore_tasks(self, user_id, task_ids=None):
+        """Возвращает задачи пользователя из архива (все или task_ids).
+
+        Восстановленные задачи получают новые id, открытым заново
+        рассчитывается напоминание. Возвращает [TaskRow] или None.
+        """
+        if not self.validate_user_id(user_id):
+            return None
+        if task_ids is not None and not self.validate_task_ids(task_ids):
+            return None
+
+        with self._get_session() as session:
+            try:
+                archived = session.scalars(
+                    archived_tasks_query(user_id, task_ids)).all()
+                if not archived:
+                    return []
+                created = session.execute(
+                    add_tasks_query(),
+                    restored_task_values(archived, utc_now())).all()
+                session.execute(delete(ArchivedTask).where(
+                    ArchivedTask.id.in_([task.id for task in archived])))
+                session.commit()
+                self._invalidate(user_id)
+                logger.info('🟩Восстановлено из архива задач пользователя '
+                            '%s: %d.', user_id, len(created))
+                return [TaskRow(row.id, row.description, row.deadline)
+                        for row in sorted(created, key=lambda row: row.id)]
+            except Exception as e:
+                logger.error(f"🛑Ошибка при восстановлении задач: {e}")
+                session.rollback()
+                return None
+            finally:
+                self.close_session(session)
+
+    def iter_open_tasks(self, chunk_size=SCAN_BATCH_SIZE, due_at=None,
+                        shard=0, shards=1):
+        """Незавершённые задачи пачками по chunk_size OpenTaskRow.
+
+        Результат читается потоково (stream_results: серверный курсор в
+        PostgreSQL) и в памяти одновременно лежит только одна пачка, так
+        что вызывающий может обрабатывать и записывать пачку до чтения
+        следующей. С due_at выбираются только задачи с наступившим к due_at
+        напоминанием, с shards — только один шард по user_id.
+        """
+        if due_at is None:
+            query = open_rows_query()
+            if shards > 1:
+                query = query.filter(Task.user_id % shards == shard)
+        else:
+            query = due_tasks_query(due_at, shard, shards)
+        query = query.execution_options(stream_results=True,
+                                        yield_per=chunk_size)
+        with self._get_session() as session:
+            try:
+                total = 0
+                for chunk in session.execute(query).partitions():
+                    total += len(chunk)
+                    yield [OpenTaskRow(*row) for row in chunk]
+                logger.info('Прочитано открытых задач (шард %d/%d): %d.',
+                            shard, shards, total)
+            except Exception as e:
+                logger.error(f"🛑Ошибка при потоковом чтении задач: {e}")
+            finally:
+                self.close_session(session)
+
+    @observe_query
+    def set_next_remind_at(self, schedule):
+        """Сохраняет новое время напоминания: {task_id: datetime}."""
+        if not schedule:
+            return True
+        with self._get_session() as session:
+            try:
+                session.execute(update(Task), [
+                    {'id': task_id, 'next_remind_at': remind_at}
+                    for task_id, remind_at in schedule.items()
+                ])
+                session.commit()
+                return True
+            except Exception as e:
+                logger.error(f"🛑Ошибка при обновлении расписания "
+                             f"напоминаний: {e}")
+                session.rollback()
+                return False
+            finally:
+                self.close_session(session)
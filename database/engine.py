@@ -0,0 +1,123 @@
+import os
+import threading
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from config import (DATABASE_MAX_OVERFLOW, DATABASE_POOL_RECYCLE,
+                    DATABASE_POOL_SIZE, DATABASE_POOL_TIMEOUT,
+                    SQLITE_BUSY_TIMEOUT, SQLITE_MMAP_SIZE)
+
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+}
+
+
+def to_async_url(database_url):
+    """Подставляет асинхронный драйвер: sqlite:// -> sqlite+aiosqlite://."""
+    url = make_url(database_url)
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if driver is None:
+        raise ValueError(f'Нет асинхронного драйвера для {url.drivername}')
+    return url.set(drivername=driver)
+
+
+def is_sqlite(database_url):
+    return make_url(database_url).get_backend_name() == 'sqlite'
+
+
+def is_sqlite_file(database_url):
+    url = make_url(database_url)
+    return (url.get_backend_name() == 'sqlite'
+            and url.database not in (None, '', ':memory:'))
+
+
+def engine_options(database_url):
+    """Параметры create_engine под выбранный бэкенд."""
+    if is_sqlite(database_url):
+        if not is_sqlite_file(database_url):
+            return {}
+        # Писатель у SQLite один: лишние соединения сверх пула только
+        # дерутся за блокировку, а ждёт её сам SQLite через busy_timeout.
+        return {
+            'pool_size': DATABASE_POOL_SIZE,
+            'max_overflow': 0,
+            'pool_timeout': DATABASE_POOL_TIMEOUT,
+            'connect_args': {'timeout': SQLITE_BUSY_TIMEOUT / 1000},
+        }
+    return {
+        'pool_size': DATABASE_POOL_SIZE,
+        'max_overflow': DATABASE_MAX_OVERFLOW,
+        'pool_timeout': DATABASE_POOL_TIMEOUT,
+        'pool_recycle': DATABASE_POOL_RECYCLE,
+        'pool_pre_ping': True,
+    }
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute(f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}')
+    cursor.execute(f'PRAGMA mmap_size={SQLITE_MMAP_SIZE}')
+    cursor.close()
+
+
+def _tune(engine, database_url):
+    if is_sqlite_file(database_url):
+        event.listen(engine, 'connect', _set_sqlite_pragmas)
+
+
+def create_db_engine(database_url):
+    """Синхронный engine с пулом или PRAGMA-настройками SQLite."""
+    engine = create_engine(database_url, **engine_options(database_url))
+    _tune(engine, database_url)
+    return engine
+
+
+def create_async_db_engine(database_url):
+    """То же для sqlalchemy.ext.asyncio (aiosqlite / asyncpg)."""
+    options = engine_options(database_url)
+    if is_sqlite_file(database_url):
+        # По умолчанию aiosqlite работает через NullPool и открывает
+        # соединение (и поток) на каждую сессию.
+        options['poolclass'] = AsyncAdaptedQueuePool
+    engine = create_async_engine(to_async_url(database_url), **options)
+    _tune(engine.sync_engine, database_url)
+    return engine
+
+
+# Общие на процесс engine по URL: Database создаёт их не в конструкторе,
+# а при первом запросе, так что импорт tasks в beat или Flower к базе
+# не подключается.
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(database_url):
+    """Engine процесса для database_url; создаётся при первом вызове."""
+    engine = _engines.get(database_url)
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.get(database_url)
+            if engine is None:
+                engine = create_db_engine(database_url)
+                _engines[database_url] = engine
+    return engine
+
+
+def _dispose_after_fork():
+    # Дочерний процесс prefork Celery унаследовал соединения пула
+    # родителя. close=False: сокеты закрывает только родитель, а дочерний
+    # просто начинает с пустого пула.
+    global _engines_lock
+    _engines_lock = threading.Lock()
+    for engine in _engines.values():
+        engine.dispose(close=False)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_dispose_after_fork)
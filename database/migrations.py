@@ -0,0 +1,191 @@
+"""Версионированные миграции схемы.
+
+Каждая миграция — функция от синхронного Connection, которая должна быть
+идемпотентной: бот, воркер и beat стартуют одновременно и могут
+применить один шаг дважды. Применённые версии хранятся в таблице
+schema_migrations, так что новые индексы доходят и до живых баз.
+"""
+from sqlalchemy import (Column, DateTime, Integer, MetaData, String, Table,
+                        bindparam, exc, false, inspect, insert, select, text,
+                        update)
+from sqlalchemy.schema import CreateIndex
+
+from config import DATABASE_MIGRATE, LOG_PATCH
+from core.logger import OvayLogger
+from core.reminders import next_remind_at, utc_now
+from database.models import ArchivedTask, Task
+
+logger = OvayLogger(
+    name='migrations_logger', log_file_path=LOG_PATCH
+).get_logger()
+
+# Произвольный ключ pg_advisory_lock для сериализации миграций.
+MIGRATIONS_LOCK_ID = 7_300_001
+
+# Сколько задач за транзакцию получает next_remind_at в backfill_remind_at.
+BACKFILL_BATCH_SIZE = 1000
+
+# URL баз, схема которых уже проверена в этом процессе. Дочерние процессы
+# prefork наследуют множество и проверку не повторяют.
+_checked = set()
+
+schema_migrations = Table(
+    'schema_migrations', MetaData(),
+    Column('version', Integer, primary_key=True),
+    Column('name', String, nullable=False),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+
+def _index(name):
+    return next(index for index in Task.__table__.indexes
+                if index.name == name)
+
+
+def create_index(connection, index):
+    """Создаёт индекс, не блокируя запись в таблицу там, где это возможно.
+
+    В PostgreSQL это CREATE INDEX CONCURRENTLY вне транзакции. SQLite так
+    не умеет, но в режиме WAL читатели на время построения не блокируются.
+    """
+    ddl = str(CreateIndex(index, if_not_exists=True).compile(
+        dialect=connection.dialect))
+    if connection.dialect.name != 'postgresql':
+        connection.execute(text(ddl))
+        return
+    connection.commit()
+    connection.execution_options(isolation_level='AUTOCOMMIT')
+    try:
+        connection.execute(text(ddl.replace(
+            'CREATE INDEX', 'CREATE INDEX CONCURRENTLY', 1)))
+    finally:
+        connection.execution_options(
+            isolation_level=connection.default_isolation_level)
+
+
+def create_tasks_table(connection):
+    Task.__table__.create(connection, checkfirst=True)
+
+
+def add_next_remind_at(connection):
+    columns = {column['name']
+               for column in inspect(connection).get_columns('tasks')}
+    if 'next_remind_at' not in columns:
+        connection.execute(text(
+            'ALTER TABLE tasks ADD COLUMN next_remind_at TIMESTAMP'))
+    create_index(connection, _index('ix_tasks_is_completed_next_remind_at'))
+
+
+def add_task_indexes(connection):
+    for name in ('ix_tasks_user_id_is_completed',
+                 'ix_tasks_is_completed_deadline',
+                 'ix_tasks_open_user_id_deadline'):
+        create_index(connection, _index(name))
+
+
+def create_archive_table(connection):
+    ArchivedTask.__table__.create(connection, checkfirst=True)
+
+
+def backfill_remind_at(connection):
+    """Рассчитывает next_remind_at открытым задачам, где его нет.
+
+    Такие задачи остались от версий до планировщика. После заполнения
+    выборка тика — чистый диапазон next_remind_at <= now по индексу, без
+    ветки IS NULL, которая заставляла обходить все открытые задачи.
+    """
+    tasks = Task.__table__
+    pending = select(tasks.c.id, tasks.c.deadline).where(
+        tasks.c.is_completed == false(),
+        tasks.c.next_remind_at.is_(None),
+    ).order_by(tasks.c.id).limit(BACKFILL_BATCH_SIZE)
+    set_remind_at = update(tasks).where(
+        tasks.c.id == bindparam('task_id')
+    ).values(next_remind_at=bindparam('remind_at'))
+    now = utc_now()
+    while True:
+        rows = connection.execute(pending).fetchall()
+        if not rows:
+            break
+        connection.execute(set_remind_at, [
+            {'task_id': task_id,
+             'remind_at': next_remind_at(deadline, now)}
+            for task_id, deadline in rows])
+        connection.commit()
+
+
+MIGRATIONS = [
+    (1, 'create tasks table', create_tasks_table),
+    (2, 'add tasks.next_remind_at', add_next_remind_at),
+    (3, 'add task access-path indexes', add_task_indexes),
+    (4, 'create tasks_archive table', create_archive_table),
+    (5, 'backfill tasks.next_remind_at', backfill_remind_at),
+]
+
+
+def _lock(connection, acquire):
+    if connection.dialect.name == 'postgresql':
+        function = 'pg_advisory_lock' if acquire else 'pg_advisory_unlock'
+        connection.execute(text(f'SELECT {function}(:key)'),
+                           {'key': MIGRATIONS_LOCK_ID})
+        connection.commit()
+
+
+def migrate(connection, target=None):
+    """Применяет недостающие миграции до версии target (по умолчанию все).
+
+    Connection передаётся без открытой транзакции: миграции сами
+    фиксируют каждый шаг.
+    """
+    _lock(connection, True)
+    try:
+        schema_migrations.create(connection, checkfirst=True)
+        connection.commit()
+        applied = set(connection.scalars(
+            select(schema_migrations.c.version)))
+        for version, name, apply in MIGRATIONS:
+            if version in applied or (target and version > target):
+                continue
+            logger.info(f'🟧Применяем миграцию {version}: {name}...')
+            apply(connection)
+            try:
+                connection.execute(insert(schema_migrations).values(
+                    version=version, name=name, applied_at=utc_now()))
+                connection.commit()
+            except exc.IntegrityError:
+                # Параллельный процесс успел записать ту же версию.
+                connection.rollback()
+            logger.info(f'🟩Миграция {version} применена.')
+    finally:
+        _lock(connection, False)
+
+
+def schema_pending(database_url):
+    """Нужно ли этому процессу проверить схему database_url.
+
+    С DATABASE_MIGRATE=off схема ведётся отдельным шагом развёртывания
+    (python -m database.migrations), и процессы её не трогают.
+    """
+    return DATABASE_MIGRATE != 'off' and database_url not in _checked
+
+
+def mark_schema_checked(database_url):
+    _checked.add(database_url)
+
+
+def main():
+    """Применяет миграции один раз на развёртывание, до старта сервисов."""
+    from config import DATABASE_URL
+    from database.engine import create_db_engine
+
+    engine = create_db_engine(DATABASE_URL)
+    try:
+        with engine.connect() as connection:
+            migrate(connection)
+    finally:
+        engine.dispose()
+    logger.info('🟩Схема базы данных актуальна.')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,5 @@
-from sqlalchemy import Boolean, Column, DateTime, Integer, String
+from sqlalchemy import (Boolean, Column, DateTime, Index, Integer, String,
+                        false)
 from sqlalchemy.orm import declarative_base
 
 Base = declarative_base()
@@ -6,9 +7,48 @@ Base = declarative_base()
 
 class Task(Base):
     __tablename__ = 'tasks'
+    __table_args__ = (
+        Index('ix_tasks_is_completed_next_remind_at',
+              'is_completed', 'next_remind_at'),
+        Index('ix_tasks_user_id_is_completed', 'user_id', 'is_completed'),
+        Index('ix_tasks_is_completed_deadline', 'is_completed', 'deadline'),
+    )
 
     id = Column(Integer, primary_key=True)
     description = Column(String, nullable=False)
     deadline = Column(DateTime, nullable=False)
     user_id = Column(Integer, nullable=False)
     is_completed = Column(Boolean, default=False)
+    # Время ближайшего напоминания в UTC, пересчитывается планировщиком.
+    next_remind_at = Column(DateTime, nullable=True)
+
+
+class ArchivedTask(Base):
+    """Задача, перенесённая из tasks фоновой архивацией.
+
+    task_id — исходный id задачи. Он не первичный ключ: SQLite может
+    выдать освободившийся id новой задаче, и та тоже попадёт в архив.
+    При восстановлении задача получает новый id.
+    """
+    __tablename__ = 'tasks_archive'
+    __table_args__ = (
+        Index('ix_tasks_archive_user_id', 'user_id'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    task_id = Column(Integer, nullable=False)
+    description = Column(String, nullable=False)
+    deadline = Column(DateTime, nullable=False)
+    user_id = Column(Integer, nullable=False)
+    is_completed = Column(Boolean, nullable=False)
+    next_remind_at = Column(DateTime, nullable=True)
+    archived_at = Column(DateTime, nullable=False)
+
+
+# Частичный индекс по открытым задачам пользователя в порядке дедлайна.
+# Условие совпадает с тем, как SQLAlchemy рендерит filter_by(
+# is_completed=False), иначе планировщик SQLite индекс не выберет.
+Index('ix_tasks_open_user_id_deadline',
+      Task.user_id, Task.deadline, Task.id,
+      sqlite_where=Task.is_completed == false(),
+      postgresql_where=Task.is_completed == false())
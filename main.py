@@ -1,20 +1,65 @@
 import os
 import sys
 
+import redis
+import redis.asyncio
 from telegram.ext import Application
 
 from bot.bot import TaskBot
-from config import DATABASE_URL, TELEGRAM_TOKEN, logger
+from config import (BOT_CONCURRENT_UPDATES, BOT_MAX_IN_FLIGHT,
+                    BOT_USER_BURST, BOT_USER_RATE, DATABASE_ASYNC_MODE,
+                    DATABASE_THREADS, DATABASE_URL,
+                    TASKS_CACHE_REDIS_URL, TASKS_CACHE_SIZE, TASKS_CACHE_TTL,
+                    TELEGRAM_API_URL, TELEGRAM_TOKEN, logger)
+from core.admission import AdmissionControl
+from core.core import HealthChecker
+from database.async_db import AsyncDatabase, ThreadedDatabase
+from database.cache import TaskCache
 from database.db import Database
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 
+def create_cache(asyncio_client):
+    """TaskCache; asyncio_client — Redis-клиент для AsyncDatabase.
+
+    ThreadedDatabase ходит в кэш из потоков пула, ему нужен синхронный
+    клиент, AsyncDatabase — redis.asyncio, чтобы не блокировать event loop.
+    """
+    redis_client = None
+    if TASKS_CACHE_REDIS_URL:
+        client_class = (redis.asyncio.Redis if asyncio_client
+                        else redis.Redis)
+        redis_client = client_class.from_url(
+            TASKS_CACHE_REDIS_URL, socket_timeout=0.1,
+            socket_connect_timeout=0.1)
+    return TaskCache(max_users=TASKS_CACHE_SIZE, ttl=TASKS_CACHE_TTL,
+                     redis_client=redis_client)
+
+
+def create_database():
+    if DATABASE_ASYNC_MODE == 'threads':
+        cache = create_cache(asyncio_client=False)
+        return ThreadedDatabase(Database(DATABASE_URL, cache=cache),
+                                max_workers=DATABASE_THREADS)
+    return AsyncDatabase(DATABASE_URL, cache=create_cache(asyncio_client=True))
+
+
 def main():
     logger.debug('start main')
-    database = Database(DATABASE_URL)
-    task_bot = Application.builder().token(TELEGRAM_TOKEN).build()
-    bot = TaskBot(task_bot, database)
+    database = create_database()
+    task_bot = (
+        Application.builder()
+        .token(TELEGRAM_TOKEN)
+        .base_url(f'{TELEGRAM_API_URL}/bot')
+        .concurrent_updates(BOT_CONCURRENT_UPDATES)
+        .build()
+    )
+    admission = AdmissionControl(BOT_USER_RATE, BOT_USER_BURST,
+                                 BOT_MAX_IN_FLIGHT,
+                                 max_users=TASKS_CACHE_SIZE)
+    bot = TaskBot(task_bot, database, health=HealthChecker(database.engine),
+                  admission=admission)
     bot.run()
 
 
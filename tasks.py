@@ -1,79 +1,131 @@
+import asyncio
 import time
 from datetime import datetime, timedelta
 
-import httpx
-from celery import Celery
+import redis
+from celery import Celery, group
 from celery.schedules import crontab
 
-from config import DATABASE_URL, LOG_PATCH, TELEGRAM_TOKEN
+from config import (ARCHIVE_BATCH_SIZE, ARCHIVE_OVERDUE_DAYS,
+                    CELERY_BROKER_URL, CELERY_METRICS_PORT, DATABASE_URL,
+                    LOG_PATCH, REDIS_BROKER_URL, REMINDER_SHARDS)
+from core.delivery import (TelegramSender, drain_outbox, enqueue_reminder,
+                           enqueue_reminders_once)
 from core.logger import OvayLogger
+from core.metrics import (REMINDER_SCAN_SECONDS, REMINDERS_DUE,
+                          REMINDERS_ENQUEUED, connect_celery_signals)
+from core.reminders import (due_slot, local_now, next_remind_at,
+                            reminder_text, utc_now)
 from database.db import Database
 
 logger = OvayLogger(name='bot_logger', log_file_path=LOG_PATCH).get_logger()
 
 database = Database(DATABASE_URL)
-REDIS_BROKER_URL = 'redis://redis:6379/0'
-celery_app = Celery('tasks', broker=REDIS_BROKER_URL)
+celery_app = Celery('tasks', broker=CELERY_BROKER_URL)
+redis_client = redis.Redis.from_url(REDIS_BROKER_URL)
+connect_celery_signals(CELERY_METRICS_PORT)
 
 
-MINUTES_AFTER_DEADLINE = 10
+@celery_app.task
+def bot_send_message(user_id, description):
+    """Оставлена для сообщений, уже лежащих в брокере: кладёт их в outbox."""
+    enqueue_reminder(redis_client, user_id, description)
 
 
 @celery_app.task
-def bot_send_message(user_id, description, retries=3):
-    url = f'https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage'
-    payload = {'chat_id': user_id, 'text': f'Напоминание {description}'}
-
-    for attempt in range(retries):
-        try:
-            response = httpx.post(url, json=payload, timeout=10)
-            response.raise_for_status()
-            logger.info(f'Message sent to user {user_id}: {description}')
-            return
-        except httpx.RequestError as e:
-            logger.error(f'Request error for user {user_id}: {e}')
-            if attempt < retries - 1:
-                time.sleep(2)
+def deliver_reminders():
+    processed = asyncio.run(drain_outbox(redis_client, TelegramSender()))
+    if processed:
+        logger.info(f'Обработано сообщений из outbox: {processed}.')
 
 
 @celery_app.task
 def send_message_task():
-    tasks = database.get_all_not_completed_tasks()
-    now = datetime.now()
+    """Ежеминутный тик: раздаёт обход задач шардам по user_id.
+
+    Каждый шард — отдельная подзадача, поэтому обход масштабируется числом
+    воркеров. Время тика одно на все шарды.
+    """
+    now = utc_now().isoformat()
+    group(send_reminders_shard.s(shard, REMINDER_SHARDS, now)
+          for shard in range(REMINDER_SHARDS)).apply_async()
+
 
+def dispatch_reminders(tasks, now):
+    """Ставит наступившие напоминания пачки и сохраняет её расписание."""
+    reminders, kinds, schedule = [], [], {}
     for task in tasks:
-        deadline = task.deadline
-        time_diff = deadline - now
-        if timedelta(days=1) >= time_diff > timedelta(seconds=0):
-            if now.hour == deadline.hour and now.minute == deadline.minute:
-                logger.info(
-                    f'Задача {task.id} за день до дедлайна. '
-                    f'Напоминание пользователю {task.user_id}.')
-                bot_send_message.delay(task.user_id,
-                                       f'№{task.id}🔔(за 1дн. до deadline ):'
-                                       f'\n' + task.description)
-        elif timedelta(seconds=0) >= time_diff >= timedelta(
-                seconds=-5):
-            if now.hour == deadline.hour and now.minute == deadline.minute:
-                logger.info(
-                    f'Задача {task.id} в день дедлайна. Напоминание '
-                    f'пользователю {task.user_id}.')
-                bot_send_message.delay(task.user_id,
-                                       f'№{task.id}🔅 (в день дедлайна)'
-                                       f':\n' + task.description)
-        elif time_diff < timedelta(seconds=0):
-            if int(abs(
-                    time_diff.total_seconds()) // 60
-                   ) % MINUTES_AFTER_DEADLINE == 0:
-                logger.info(
-                    f'Задача {task.id} просрочена. Напоминание'
-                    f' пользователю {task.user_id} каждую'
-                    f'{MINUTES_AFTER_DEADLINE} минуту.')
-                bot_send_message.delay(
-                    task.user_id,
-                    f'№{task.id}⚠️ (просрочено,'
-                    f' напоминаем с повтором {MINUTES_AFTER_DEADLINE} '
-                    f'мин.):\n' + task.description)
+        slot = due_slot(task.deadline, now)
+        if slot:
+            kind, slot_at = slot
+            reminders.append((task.id, slot_at, task.user_id,
+                              reminder_text(kind, task.id,
+                                            task.description)))
+            kinds.append(kind)
+        schedule[task.id] = next_remind_at(task.deadline, now)
+    if reminders:
+        enqueued = enqueue_reminders_once(redis_client, reminders)
+        for (task_id, _, user_id, _), kind, added in zip(reminders, kinds,
+                                                         enqueued):
+            if added:
+                REMINDERS_ENQUEUED.labels(kind).inc()
+                logger.info('Задача %s: напоминание (%s) пользователю %s.',
+                            task_id, kind, user_id)
+    database.set_next_remind_at(schedule)
+
+
+@celery_app.task
+def send_reminders_shard(shard, shards, now):
+    """Напоминания одного шарда на момент тика now.
+
+    Решение «слать или нет» принимает журнал отправленных слотов, а не
+    совпадение минут: опоздавший тик догоняет пропущенное последним
+    наступившим слотом, повторный — ничего не дублирует. Задачи читаются
+    потоково и каждая пачка уходит в outbox до чтения следующей: память
+    не растёт с числом задач, а доставка начинается до конца обхода.
+    """
+    now = datetime.fromisoformat(now)
+    with REMINDER_SCAN_SECONDS.time():
+        for tasks in database.iter_open_tasks(due_at=now, shard=shard,
+                                              shards=shards):
+            REMINDERS_DUE.inc(len(tasks))
+            dispatch_reminders(tasks, now)
+
+
+# Сколько секунд один запуск archive_tasks переносит пачки, чтобы не
+# занимать воркер надолго; остаток заберёт следующий запуск.
+ARCHIVE_TIME_BUDGET = 60
+
+
+@celery_app.task
+def archive_tasks():
+    """Переносит завершённые задачи в tasks_archive пачками.
+
+    Каждая пачка — отдельная короткая транзакция, так что бот и обход
+    напоминаний не ждут блокировок всей таблицы. С ARCHIVE_OVERDUE_DAYS
+    в архив уходят и открытые задачи, просроченные дольше этого срока.
+    """
+    overdue_before = None
+    if ARCHIVE_OVERDUE_DAYS:
+        overdue_before = local_now() - timedelta(days=ARCHIVE_OVERDUE_DAYS)
+    archived = 0
+    started = time.monotonic()
+    while time.monotonic() - started < ARCHIVE_TIME_BUDGET:
+        moved = database.archive_tasks(ARCHIVE_BATCH_SIZE, overdue_before)
+        if not moved:
+            break
+        archived += moved
+        if moved < ARCHIVE_BATCH_SIZE:
+            break
+    if archived:
+        logger.info(f'Перенесено в архив задач: {archived}.')
+
+
+@celery_app.task
+def restore_archived_tasks(user_id, task_ids=None):
+    """Возвращает задачи пользователя из архива; id у них будут новые."""
+    restored = database.restore_tasks(user_id, task_ids)
+    return [task.id for task in restored or []]
 
 
 celery_app.conf.beat_schedule = {
@@ -81,5 +133,13 @@ celery_app.conf.beat_schedule = {
         'task': 'tasks.send_message_task',
         'schedule': crontab(minute='*'),
     },
+    'deliver-reminders': {
+        'task': 'tasks.deliver_reminders',
+        'schedule': 5.0,
+    },
+    'archive-tasks-hourly': {
+        'task': 'tasks.archive_tasks',
+        'schedule': crontab(minute=17),
+    },
 }
 celery_app.conf.timezone = 'UTC'
@@ -0,0 +1,25 @@
+import os
+import sys
+import tempfile
+
+import fakeredis
+import pytest
+import redis
+
+# Лог по умолчанию пишется в /bot/bot.log, которого вне контейнера нет.
+os.environ.setdefault('BOT_LOG_FILE_PATH',
+                      os.path.join(tempfile.mkdtemp(), 'bot.log'))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+
+
+@pytest.fixture
+def redis_client():
+    """Redis с Lua: настоящий из TEST_REDIS_URL (база очищается) или
+    fakeredis, который выполняет те же скрипты."""
+    url = os.getenv('TEST_REDIS_URL')
+    client = redis.Redis.from_url(url) if url else fakeredis.FakeRedis()
+    client.flushdb()
+    yield client
+    client.flushdb()
+    client.close()
@@ -0,0 +1,38 @@
+import asyncio
+
+import pytest
+
+from bot.bot import TaskBot
+from database.cache import TaskCache
+
+
+class BlockingDatabase:
+    """get_tasks_page ждёт release, чтобы чтения были «в полёте»."""
+
+    def __init__(self):
+        self.cache = TaskCache()
+        self.release = asyncio.Event()
+        self.reads = 0
+
+    async def get_tasks_page(self, user_id, after=None, before=None):
+        self.reads += 1
+        version = self.reads
+        await self.release.wait()
+        return [version], False
+
+
+@pytest.mark.asyncio
+async def test_page_reads_coalesce_until_write():
+    database = BlockingDatabase()
+    bot = TaskBot(None, database)
+    first = asyncio.ensure_future(bot.get_tasks_page(1))
+    same = asyncio.ensure_future(bot.get_tasks_page(1))
+    await asyncio.sleep(0)
+    # Запись пользователя между двумя /list.
+    database.cache.invalidate(1)
+    after_write = asyncio.ensure_future(bot.get_tasks_page(1))
+    await asyncio.sleep(0)
+    database.release.set()
+    assert await first == await same == ([1], False)
+    assert await after_write == ([2], False)
+    assert database.reads == 2
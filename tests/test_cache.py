@@ -0,0 +1,60 @@
+import asyncio
+from datetime import datetime
+
+import fakeredis
+import pytest
+
+from database.cache import MISS, TaskCache, TaskRow, cache_key
+
+ROWS = [TaskRow(1, 'задача', datetime(2030, 6, 10, 12, 0))]
+
+
+class SlowRedis(fakeredis.FakeAsyncRedis):
+    """Redis, который отвечает на каждую команду с задержкой."""
+
+    async def execute_command(self, *args, **options):
+        await asyncio.sleep(0.05)
+        return await super().execute_command(*args, **options)
+
+
+@pytest.mark.asyncio
+async def test_async_tiers_round_trip():
+    redis_client = fakeredis.FakeAsyncRedis()
+    writer = TaskCache(redis_client=redis_client)
+    reader = TaskCache(redis_client=redis_client)
+    await writer.aset(1, cache_key(), ROWS, writer.generation(1))
+    # Второй процесс бота видит запись через Redis.
+    assert await reader.aget(1, cache_key()) == ROWS
+    await writer.ainvalidate(1)
+    assert await TaskCache(redis_client=redis_client).aget(
+        1, cache_key()) is MISS
+
+
+@pytest.mark.asyncio
+async def test_corrupt_redis_entry_is_a_miss():
+    redis_client = fakeredis.FakeAsyncRedis()
+    cache = TaskCache(redis_client=redis_client)
+    await redis_client.hset('tasks:cache:1', cache_key(), '{"rows": [[1]]}')
+    await redis_client.hset('tasks:cache:1', 'page:after::5', 'not json')
+    assert await cache.aget(1, cache_key()) is MISS
+    assert await cache.aget(1, 'page:after::5') is MISS
+    assert cache.stats()['misses'] == 2
+
+
+@pytest.mark.asyncio
+async def test_slow_redis_does_not_block_event_loop():
+    cache = TaskCache(redis_client=SlowRedis())
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0.005)
+
+    task = asyncio.ensure_future(ticker())
+    await asyncio.gather(*(cache.aget(user_id, cache_key())
+                           for user_id in range(10)))
+    task.cancel()
+    # Десять запросов по 50 мс идут параллельно и не держат цикл.
+    assert ticks >= 5
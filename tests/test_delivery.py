@@ -0,0 +1,113 @@
+import calendar
+import json
+import time
+from datetime import datetime
+
+import httpx
+import pytest
+
+from core.delivery import (DIGEST_KEY_PREFIX, DIGESTS_KEY, MESSAGE_LIMIT,
+                           MESSAGE_PREFIX, SENT_KEY, TelegramSender,
+                           enqueue_reminders_once, pop_due_digests,
+                           split_lines)
+
+
+def test_split_lines_keeps_lines_whole_and_in_order():
+    lines = [f'{n}. ' + 'д' * 300 for n in range(50)]
+    parts = split_lines(lines)
+    assert len(parts) > 1
+    assert all(len(part) <= MESSAGE_LIMIT for part in parts)
+    assert '\n'.join(parts).split('\n') == lines
+
+
+def test_split_lines_cuts_line_longer_than_limit():
+    assert split_lines(['a' * 10, 'b'], limit=4) == ['aaaa', 'b']
+    assert split_lines(['a' * 10, 'b'], limit=8, header='h') == [
+        'h\naaaaaa', 'h\nb']
+
+
+def digest_parts(chat_id, count):
+    return [{'id': f'{chat_id}-{n}', 'chat_id': chat_id, 'text': f'часть {n}',
+             'attempt': 0} for n in range(count)]
+
+
+async def send_batch(messages, respond):
+    sender = TelegramSender(token='test', api_url='http://telegram',
+                            global_rate=10 ** 6, chat_rate=100)
+    sent = []
+
+    def handler(request):
+        payload = json.loads(request.content)
+        sent.append((payload['chat_id'], payload['text']))
+        return respond(payload)
+
+    sender.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    retries = await sender.send_batch(messages)
+    await sender.client.aclose()
+    return sent, retries
+
+
+@pytest.mark.asyncio
+async def test_digest_parts_of_one_chat_go_out_in_order():
+    # Пакет с частями двух чатов вперемешку, как из pop_due_digests.
+    messages = [part for pair in zip(digest_parts(1, 4), digest_parts(2, 4))
+                for part in pair]
+    sent, retries = await send_batch(
+        messages, lambda payload: httpx.Response(200, json={'ok': True}))
+    assert retries == []
+    for chat_id in (1, 2):
+        assert [text for chat, text in sent if chat == chat_id] == [
+            f'{MESSAGE_PREFIX}часть {n}' for n in range(4)]
+
+
+@pytest.mark.asyncio
+async def test_retry_takes_following_parts_with_it():
+    def respond(payload):
+        if payload['text'].endswith('часть 1'):
+            return httpx.Response(429, json={
+                'ok': False, 'parameters': {'retry_after': 7}})
+        return httpx.Response(200, json={'ok': True})
+
+    parts = digest_parts(1, 3)
+    sent, retries = await send_batch(parts, respond)
+    assert [text for _, text in sent] == [
+        f'{MESSAGE_PREFIX}часть 0', f'{MESSAGE_PREFIX}часть 1']
+    assert retries == [(parts[1], (7, False)), (parts[2], (7, False))]
+
+
+SLOT = datetime(2030, 6, 10, 9, 0)
+
+
+def test_enqueue_once_logs_slot_and_builds_digest(redis_client):
+    started = time.time()
+    assert enqueue_reminders_once(redis_client, [
+        (1, SLOT, 10, 'первое'), (2, SLOT, 10, 'второе'),
+        (1, SLOT, 10, 'первое снова')], window=-1) == [True, True, False]
+    score = calendar.timegm(SLOT.utctimetuple())
+    assert redis_client.zrange(SENT_KEY, 0, -1, withscores=True) == [
+        (b'1:203006100900', score), (b'2:203006100900', score)]
+    assert redis_client.lrange(f'{DIGEST_KEY_PREFIX}10', 0, -1) == [
+        'первое'.encode(), 'второе'.encode()]
+    flush_at = redis_client.zscore(DIGESTS_KEY, '10')
+    assert started - 1 <= flush_at <= time.time() - 1
+    # Пользователь уже ждёт дайджест: время отправки не сдвигается.
+    assert enqueue_reminders_once(redis_client, [(3, SLOT, 10, 'третье')],
+                                  window=100) == [True]
+    assert redis_client.zscore(DIGESTS_KEY, '10') == flush_at
+
+    [message] = pop_due_digests(redis_client)
+    assert message['chat_id'] == 10
+    assert message['text'] == 'о задачах (3):\n\nпервое\n\nвторое\n\nтретье'
+    assert not redis_client.exists(f'{DIGEST_KEY_PREFIX}10')
+    assert pop_due_digests(redis_client) == []
+
+
+def test_enqueue_once_forgets_slots_older_than_ttl(redis_client):
+    old_slot = datetime(2000, 1, 1)
+    assert enqueue_reminders_once(
+        redis_client, [(1, old_slot, 10, 'старое'), (2, SLOT, 10, 'новое')],
+        ttl=3600) == [True, True]
+    # Запись старше ttl вычищается тем же скриптом перед проверкой.
+    assert enqueue_reminders_once(
+        redis_client, [(1, old_slot, 10, 'старое'), (2, SLOT, 10, 'новое')],
+        ttl=3600) == [True, False]
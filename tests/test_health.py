@@ -0,0 +1,24 @@
+import fakeredis
+import pytest
+from sqlalchemy import create_engine
+
+from core.core import LIVENESS_CHECKS, HealthChecker
+
+
+@pytest.mark.asyncio
+async def test_liveness_ignores_celery_and_flower():
+    # Воркеров Celery нет, Flower не отвечает.
+    checker = HealthChecker(create_engine('sqlite://'),
+                            flower_url='http://127.0.0.1:1',
+                            broker_url='memory://', timeout=0.2)
+    await checker.redis.aclose()
+    checker.redis = fakeredis.FakeAsyncRedis()
+    try:
+        assert await checker.check(LIVENESS_CHECKS) == {
+            'ok': True, 'checks': {'database': True, 'redis': True}}
+        readiness = await checker.check()
+        assert not readiness['ok']
+        assert readiness['checks']['celery'] is False
+        assert readiness['checks']['flower'] is False
+    finally:
+        await checker.close()
@@ -0,0 +1,69 @@
+import random
+import re
+import string
+from datetime import datetime
+
+import pytest
+
+from core.parser import parse_task
+
+NOW = datetime(2030, 6, 1, 12, 0, 30)
+ABSOLUTE_RE = re.compile(r'\d{2}-\d{2}-\d{4}-\d{2}-\d{2}')
+ALPHABET = string.ascii_letters + string.digits + ' -+:.' + 'завтрчмд'
+
+
+def random_line(rng):
+    if rng.random() < 0.5:
+        return ''.join(rng.choice(ALPHABET)
+                       for _ in range(rng.randint(0, 40)))
+    date = (f'{rng.randint(0, 39):02}-{rng.randint(0, 19):02}-'
+            f'{rng.randint(1, 9999):04}-{rng.randint(0, 29):02}-'
+            f'{rng.randint(0, 69):02}')
+    return f'{rng.choice(["Купить", "Отчёт +2", "a b"])} {date}'
+
+
+@pytest.mark.parametrize('line, description, deadline', [
+    ('Купить молоко 31-12-2030-18-30', 'Купить молоко',
+     datetime(2030, 12, 31, 18, 30)),
+    ('Отчёт 01-02-2031-09-05 и хвост', 'Отчёт и хвост',
+     datetime(2031, 2, 1, 9, 5)),
+    ('Позвонить маме +2h', 'Позвонить маме', datetime(2030, 6, 1, 14, 0)),
+    ('Позвонить +30m', 'Позвонить', datetime(2030, 6, 1, 12, 30)),
+    ('Полить цветы +3д', 'Полить цветы', datetime(2030, 6, 4, 12, 0)),
+    ('Отчёт завтра 10:00', 'Отчёт', datetime(2030, 6, 2, 10, 0)),
+    ('Отчёт сегодня 9:15', 'Отчёт', datetime(2030, 6, 1, 9, 15)),
+    ('Report TOMORROW 23:59', 'Report', datetime(2030, 6, 2, 23, 59)),
+])
+def test_parse_task(line, description, deadline):
+    assert parse_task(line, NOW) == (description, deadline)
+
+
+@pytest.mark.parametrize('line', [
+    'Отчёт 31-02-2031-10-00',
+    'Отчёт 00-01-2031-10-00',
+    'Отчёт 01-13-2031-10-00',
+    'Отчёт 01-01-2031-25-00',
+    'Отчёт завтра 24:00',
+    'Отчёт сегодня 12:60',
+    'Отчёт без даты',
+    '31-12-2030-18-30',
+    '',
+])
+def test_parse_task_rejects(line):
+    with pytest.raises(ValueError):
+        parse_task(line, NOW)
+
+
+def test_random_lines_raise_only_value_error():
+    rng = random.Random(17)
+    for _ in range(20000):
+        line = random_line(rng)
+        try:
+            description, deadline = parse_task(line, NOW)
+        except ValueError:
+            continue
+        assert description
+        absolute = ABSOLUTE_RE.search(line)
+        if absolute and absolute.group(0) not in description:
+            assert deadline == datetime.strptime(absolute.group(0),
+                                                 '%d-%m-%Y-%H-%M'), line
@@ -0,0 +1,151 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import tasks
+from config import MINUTES_AFTER_DEADLINE
+from core.delivery import DIGEST_KEY_PREFIX, SENT_KEY
+from core.reminders import (DAY_BEFORE, DEADLINE, OVERDUE, deadline_to_utc,
+                            due_slot, next_remind_at)
+from database.db import Database
+from database.migrations import backfill_remind_at
+from database.models import Task
+
+# Дедлайн в часовом поясе пользователей, как его сохраняет /add.
+DEADLINE_AT = datetime(2030, 6, 10, 12, 0)
+DEADLINE_UTC = deadline_to_utc(DEADLINE_AT)
+DAY_BEFORE_UTC = deadline_to_utc(DEADLINE_AT - timedelta(days=1))
+STEP = timedelta(minutes=MINUTES_AFTER_DEADLINE)
+SECOND = timedelta(seconds=1)
+
+
+def enqueued(redis_client):
+    """Слоты из журнала отправленных напоминаний.
+
+    Каждый слот должен дать ровно одну запись в дайджесте пользователя,
+    иначе напоминание ушло бы дважды.
+    """
+    slots = {member.decode()
+             for member in redis_client.zrange(SENT_KEY, 0, -1)}
+    texts = sum(redis_client.llen(key) for key in
+                redis_client.scan_iter(f'{DIGEST_KEY_PREFIX}*'))
+    assert texts == len(slots)
+    return slots
+
+
+@pytest.mark.parametrize('now, expected', [
+    (DAY_BEFORE_UTC - SECOND, None),
+    (DAY_BEFORE_UTC, (DAY_BEFORE, DAY_BEFORE_UTC)),
+    (DEADLINE_UTC - SECOND, (DAY_BEFORE, DAY_BEFORE_UTC)),
+    (DEADLINE_UTC, (DEADLINE, DEADLINE_UTC)),
+    (DEADLINE_UTC + STEP - SECOND, (DEADLINE, DEADLINE_UTC)),
+    (DEADLINE_UTC + STEP, (OVERDUE, DEADLINE_UTC + STEP)),
+    (DEADLINE_UTC + STEP * 5 / 2, (OVERDUE, DEADLINE_UTC + STEP * 2)),
+])
+def test_due_slot_boundaries(now, expected):
+    assert due_slot(DEADLINE_AT, now) == expected
+
+
+@pytest.mark.parametrize('after, expected', [
+    (DAY_BEFORE_UTC - SECOND, DAY_BEFORE_UTC),
+    (DAY_BEFORE_UTC, DEADLINE_UTC),
+    (DEADLINE_UTC - SECOND, DEADLINE_UTC),
+    (DEADLINE_UTC, DEADLINE_UTC + STEP),
+    (DEADLINE_UTC + STEP - SECOND, DEADLINE_UTC + STEP),
+    (DEADLINE_UTC + STEP, DEADLINE_UTC + STEP * 2),
+])
+def test_next_remind_at_boundaries(after, expected):
+    assert next_remind_at(DEADLINE_AT, after) == expected
+
+
+def test_next_remind_at_follows_due_slot():
+    # Слот, на который указывает расписание, сразу становится наступившим.
+    now = DAY_BEFORE_UTC - timedelta(hours=1)
+    for _ in range(5):
+        remind_at = next_remind_at(DEADLINE_AT, now)
+        assert due_slot(DEADLINE_AT, remind_at)[1] == remind_at
+        now = remind_at
+
+
+@pytest.fixture
+def frozen_tasks(monkeypatch, tmp_path, redis_client):
+    """tasks с SQLite во временном файле и Redis, выполняющим Lua."""
+    database = Database(f"sqlite:///{tmp_path / 'tasks.db'}")
+    database.init_db()
+    monkeypatch.setattr(tasks, 'database', database)
+    monkeypatch.setattr(tasks, 'redis_client', redis_client)
+    yield database, redis_client
+    database.engine.dispose()
+
+
+def add_task(database, user_id, start):
+    task = database.add_task('задача', DEADLINE_AT, user_id)
+    # Расписание — от замороженного начала, а не от текущих часов.
+    database.set_next_remind_at(
+        {task.id: next_remind_at(DEADLINE_AT, start)})
+    return task.id
+
+
+def tick(now, shards=2):
+    for shard in range(shards):
+        tasks.send_reminders_shard(shard, shards, now.isoformat())
+
+
+def test_duplicated_ticks_enqueue_each_slot_once(frozen_tasks):
+    database, redis_client = frozen_tasks
+    start = DAY_BEFORE_UTC - timedelta(hours=1)
+    task_ids = [add_task(database, user_id, start) for user_id in (1, 2, 3)]
+    # Тики реже минуты, но чаще повторов: каждый слот застаёт хотя бы
+    # один тик, и каждый тик приходит дважды.
+    now = start
+    while now < DEADLINE_UTC + STEP * 4:
+        tick(now)
+        tick(now)
+        now += timedelta(minutes=7)
+    expected = {f'{task_id}:{slot:%Y%m%d%H%M}'
+                for task_id in task_ids
+                for slot in (DAY_BEFORE_UTC, DEADLINE_UTC,
+                             DEADLINE_UTC + STEP, DEADLINE_UTC + STEP * 2,
+                             DEADLINE_UTC + STEP * 3)}
+    assert enqueued(redis_client) == expected
+
+
+def test_late_tick_sends_latest_slot_once(frozen_tasks):
+    database, redis_client = frozen_tasks
+    task_id = add_task(database, 1, DAY_BEFORE_UTC - timedelta(hours=1))
+    # Воркер простоял с дня до дедлайна до середины второго повтора.
+    late = DEADLINE_UTC + STEP * 5 / 2
+    tick(late)
+    tick(late + timedelta(minutes=1))
+    assert enqueued(redis_client) == {
+        f'{task_id}:{DEADLINE_UTC + STEP * 2:%Y%m%d%H%M}'}
+
+
+def test_slow_overlapping_ticks_do_not_duplicate(frozen_tasks):
+    database, redis_client = frozen_tasks
+    task_id = add_task(database, 1, DAY_BEFORE_UTC - timedelta(hours=1))
+    # Медленный тик прочитал задачи, но ещё не записал расписание, а
+    # следующий тик уже читает те же строки.
+    slow = [row for chunk in database.iter_open_tasks(due_at=DEADLINE_UTC)
+            for row in chunk]
+    fast = [row for chunk in database.iter_open_tasks(
+        due_at=DEADLINE_UTC + timedelta(minutes=1)) for row in chunk]
+    tasks.dispatch_reminders(fast, DEADLINE_UTC + timedelta(minutes=1))
+    tasks.dispatch_reminders(slow, DEADLINE_UTC)
+    tick(DEADLINE_UTC + timedelta(minutes=2))
+    assert enqueued(redis_client) == {
+        f'{task_id}:{DEADLINE_UTC:%Y%m%d%H%M}'}
+
+
+def test_backfill_puts_legacy_tasks_into_due_range(frozen_tasks):
+    database, redis_client = frozen_tasks
+    # Задача из версии до планировщика: next_remind_at не задан.
+    task_id = database.add_task('задача', DEADLINE_AT, 1).id
+    with database.engine.begin() as connection:
+        connection.execute(Task.__table__.update().values(
+            next_remind_at=None))
+    with database.engine.connect() as connection:
+        backfill_remind_at(connection)
+    tick(DAY_BEFORE_UTC + SECOND)
+    assert enqueued(redis_client) == {
+        f'{task_id}:{DAY_BEFORE_UTC:%Y%m%d%H%M}'}